@@ -58,6 +58,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "projects.db_router.ReplicaPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -90,9 +91,67 @@ DATABASES = {
     "default": {
         "ENGINE": os.getenv("DB_ENGINE"),
         "NAME": os.path.join(BASE_DIR, os.getenv("DB_NAME", "db.sqlite3")),
+        # Переиспользуем соединение между запросами вместо открытия нового
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Продакшен-профиль SQLite: WAL (читатели не ждут писателя), ожидание
+# блокировки вместо "database is locked" и кеш страниц в памяти.
+# Прагмы выполняются при каждом открытии соединения
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "True") == "True"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+if (
+    DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3"
+    and SQLITE_TUNING
+):
+    DATABASES["default"]["OPTIONS"] = {
+        "init_command": ";".join(
+            f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()
+        ),
+        # Запись сразу берет блокировку: иначе транзакция, начавшая с
+        # чтения, не дождется писателя и упадет с "database is locked"
+        "transaction_mode": "IMMEDIATE",
+        # Таймаут модуля sqlite3 в секундах, согласован с busy_timeout
+        "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+    }
+
+# Реплика для чтения (GET-запросы API, см. projects.db_router). Локально
+# это вторая SQLite-база, которую обновляет команда sync_replica
+DB_REPLICA_NAME = os.getenv("DB_REPLICA_NAME")
+DATABASE_REPLICA = None
+if DB_REPLICA_NAME:
+    DATABASE_REPLICA = "replica"
+    DATABASES[DATABASE_REPLICA] = {
+        **DATABASES["default"],
+        "NAME": os.path.join(BASE_DIR, DB_REPLICA_NAME),
+        # В тестах реплика — та же база, что и основная
+        "TEST": {"MIRROR": "default"},
+    }
+    if "init_command" in DATABASES[DATABASE_REPLICA].get("OPTIONS", {}):
+        options = dict(DATABASES[DATABASE_REPLICA]["OPTIONS"])
+        # Случайная запись в реплику — ошибка, а не расхождение с основной
+        options["init_command"] += ";PRAGMA query_only=ON"
+        # Реплика только читает: блокировка на запись ей не нужна
+        options.pop("transaction_mode", None)
+        DATABASES[DATABASE_REPLICA]["OPTIONS"] = options
+
+DATABASE_ROUTERS = ["projects.db_router.PrimaryReplicaRouter"]
+
+# После записи чтения клиента идут в основную базу столько секунд:
+# должно быть больше отставания реплики
+REPLICA_PIN_COOKIE = "db_pin"
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "10"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -175,6 +234,102 @@ MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media/")
 
 
+def env_list(name, default):
+    """Список из переменной окружения через запятую: пробелы вокруг
+    элементов и пустые элементы ("webp, jpeg,") отбрасываются."""
+    items = os.getenv(name, default).split(",")
+    return [item.strip() for item in items if item.strip()]
+
+
+# Лестница ширин и форматы адаптивных вариантов изображений (srcset)
+IMAGE_VARIANT_WIDTHS = [
+    int(width)
+    for width in env_list("IMAGE_VARIANT_WIDTHS", "320,640,1024,1600")
+]
+IMAGE_VARIANT_FORMATS = [
+    image_format.lower()
+    for image_format in env_list("IMAGE_VARIANT_FORMATS", "avif,webp,jpeg")
+]
+
+# Через сколько секунд задание очереди изображений, взятое воркером,
+# считается брошенным (воркер упал) и возвращается в очередь
+IMAGE_JOB_LEASE_SECONDS = int(os.getenv("IMAGE_JOB_LEASE_SECONDS", "900"))
+
+# Ограничения декодирования: исходники уменьшаются до IMAGE_MAX_DIMENSION
+# по длинной стороне, изображения больше IMAGE_MAX_PIXELS не обрабатываются
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2560"))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "100000000"))
+
+# Максимальный размер файла, загружаемого через /api/v1/upload/
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv("IMAGE_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024))
+)
+
+# Дисковый LRU-кеш для /media/resize/<w>x<h>/<path>
+RESIZE_CACHE_DIR = os.getenv(
+    "RESIZE_CACHE_DIR", os.path.join(BASE_DIR, "cache", "resize")
+)
+RESIZE_CACHE_MAX_BYTES = int(
+    os.getenv("RESIZE_CACHE_MAX_BYTES", str(512 * 1024 * 1024))
+)
+# Ступени размеров для /media/resize/: запрошенные стороны округляются
+# вверх до ступени, большие последней ступени не отдаются
+RESIZE_STEPS = sorted(
+    int(step)
+    for step in os.getenv(
+        "RESIZE_STEPS", "160,320,480,640,800,1024,1280,1600,2048,2560"
+    ).split(",")
+)
+
+# Сколько секунд хранится COUNT(*) для пагинации; запись в модель
+# сбрасывает его раньше
+COUNT_CACHE_TIMEOUT = int(os.getenv("COUNT_CACHE_TIMEOUT", "300"))
+
+# Кеш: file (по умолчанию), redis или locmem. Записи сбрасывают кеш
+# ответов через версии моделей в самом кеше, поэтому он должен быть общим
+# для всех процессов: web, воркера изображений (docker-compose) и команд
+# manage.py (sync_replica, repair_counters, render_detail_text). locmem
+# свой в каждом процессе — только для разработки в одном процессе
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+}
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "file")
+CACHE_LOCATION = os.getenv(
+    "CACHE_LOCATION",
+    {
+        "locmem": "",
+        "file": os.path.join(BASE_DIR, "cache", "django"),
+        "redis": "redis://127.0.0.1:6379/1",
+    }[CACHE_BACKEND],
+)
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": CACHE_LOCATION,
+    }
+}
+if CACHE_BACKEND in ("file", "locmem"):
+    # По умолчанию Django держит 300 записей, а кеш фрагментов заводит
+    # запись на каждый объект и набор полей: при таком пределе записи
+    # вытесняли бы друг друга уже на первых страницах списков.
+    # file при каждой записи читает список файлов каталога, поэтому
+    # предел не стоит делать намного больше; под большую нагрузку — redis.
+    # При переполнении удаляется 1/CULL_FREQUENCY записей
+    CACHES["default"]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "20000")),
+        "CULL_FREQUENCY": int(os.getenv("CACHE_CULL_FREQUENCY", "10")),
+    }
+
+# Сколько секунд хранятся ответы API; запись в модель сбрасывает их раньше
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", "600"))
+
+# Сколько секунд хранятся сериализованные объекты. Ключ включает
+# time_update, так что устаревшие фрагменты не читаются и без истечения
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv("FRAGMENT_CACHE_TIMEOUT", "86400"))
+
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
@@ -20,6 +20,7 @@ from projects.views import (
     ProjectAPIList,
     ProjectAPIUpdate,
     RegisterView,
+    resize_image,
     upload_image,
 )
 
@@ -53,6 +54,11 @@ urlpatterns = [
     path(
         "api/v1/upload/", upload_image, name="upload_image"
     ),  # Подключаем URL вашего приложения
+    path(
+        "media/resize/<int:width>x<int:height>/<path:path>",
+        resize_image,
+        name="resize_image",
+    ),
 ]
 
 
@@ -1,6 +1,15 @@
 from django.contrib import admin
 
-from .models import Article, ArticleCategory, Initiative, Project
+from .models import (
+    Article,
+    ArticleCategory,
+    ArticleDetail,
+    ImageJob,
+    Initiative,
+    InitiativeDetail,
+    Project,
+    ProjectDetail,
+)
 
 
 class ExcludeFieldsModelAdmin(admin.ModelAdmin):
@@ -34,7 +43,39 @@ class ExcludeFieldsModelAdmin(admin.ModelAdmin):
         return fieldsets
 
 
-admin.site.register(Project, ExcludeFieldsModelAdmin)
-admin.site.register(Initiative, ExcludeFieldsModelAdmin)
-admin.site.register(Article, ExcludeFieldsModelAdmin)
+class DetailInline(admin.StackedInline):
+    """detail_text и json_blocks — в отдельной таблице деталей."""
+
+    can_delete = False
+    max_num = 1
+
+
+class ProjectDetailInline(DetailInline):
+    model = ProjectDetail
+
+
+class InitiativeDetailInline(DetailInline):
+    model = InitiativeDetail
+
+
+class ArticleDetailInline(DetailInline):
+    model = ArticleDetail
+
+
+@admin.register(Project)
+class ProjectAdmin(ExcludeFieldsModelAdmin):
+    inlines = [ProjectDetailInline]
+
+
+@admin.register(Initiative)
+class InitiativeAdmin(ExcludeFieldsModelAdmin):
+    inlines = [InitiativeDetailInline]
+
+
+@admin.register(Article)
+class ArticleAdmin(ExcludeFieldsModelAdmin):
+    inlines = [ArticleDetailInline]
+
+
 admin.site.register(ArticleCategory)
+admin.site.register(ImageJob)
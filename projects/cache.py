@@ -0,0 +1,133 @@
+"""Версии моделей, кеш COUNT для пагинации и кеш ответов API.
+
+У каждой модели в кеше хранится счетчик версии, который увеличивается
+при любой записи (см. ``projects.signals``). Версия входит в ключи
+кешированных значений, поэтому после записи старые значения просто
+перестают читаться и вытесняются кешем сами.
+
+Пока чтения клиента закреплены за основной базой (``pinned_to_primary``),
+кеш не читается и не пополняется: значения в нем могли прийти с реплики,
+которая еще не видит записи клиента.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .db_router import pinned_to_primary
+
+
+def _version_key(model):
+    return f"model-version:{model._meta.label_lower}"
+
+
+def model_version(model):
+    version = cache.get(_version_key(model))
+    if version is None:
+        # Счетчик вытеснен из кеша: начинаем с нового значения, чтобы не
+        # совпасть со старыми версиями, под которыми еще лежат данные
+        version = time.time_ns()
+        if not cache.add(_version_key(model), version, timeout=None):
+            version = cache.get(_version_key(model), version)
+    return version
+
+
+def bump_model_version(model):
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        cache.set(_version_key(model), time.time_ns(), timeout=None)
+
+
+def invalidate_model(model):
+    """Сбрасывает кешированные значения модели после записи.
+
+    Версия увеличивается сразу и еще раз после коммита: иначе запрос,
+    прочитавший старые данные до коммита, закешировал бы их под новой
+    версией.
+    """
+    bump_model_version(model)
+    transaction.on_commit(lambda: bump_model_version(model))
+
+
+def _versions(models):
+    return ".".join(str(model_version(model_class)) for model_class in models)
+
+
+def queryset_signature(queryset):
+    """Хеш SQL и параметров запроса: одинаковые фильтры дают один ключ."""
+    sql, params = queryset.query.sql_with_params()
+    return hashlib.sha1(f"{sql}|{params!r}".encode()).hexdigest()
+
+
+def cached_count(queryset):
+    model = queryset.model
+    try:
+        signature = queryset_signature(queryset)
+    except EmptyResultSet:
+        # Условие, которому ничего не соответствует (пустой __in):
+        # запрос в БД не нужен, кешировать нечего
+        return 0
+    if pinned_to_primary():
+        return queryset.count()
+    key = f"count:{model._meta.label_lower}:{model_version(model)}:{signature}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=settings.COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def cached_validators(queryset, related_models=()):
+    """``(max(time_update), число строк)`` запроса для ETag и
+    Last-Modified.
+
+    Кешируется, как COUNT, по сигнатуре запроса и версиям модели
+    и связанных моделей: повторный GET не сканирует таблицу ради
+    агрегата.
+    """
+    model = queryset.model
+    try:
+        signature = queryset_signature(queryset)
+    except EmptyResultSet:
+        return None, 0
+    if pinned_to_primary():
+        return _validators(queryset)
+    versions = _versions((model, *related_models))
+    key = f"validators:{model._meta.label_lower}:{versions}:{signature}"
+    validators = cache.get(key)
+    if validators is None:
+        validators = _validators(queryset)
+        cache.set(key, validators, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+    return validators
+
+
+def _validators(queryset):
+    aggregate = queryset.aggregate(
+        last_modified=Max("time_update"), count=Count("pk")
+    )
+    return aggregate["last_modified"], aggregate["count"]
+
+
+def response_cache_key(model, related_models, request, variant=""):
+    """Ключ ответа: URL с query string, область авторизации, вариант
+    (ETag, под который построено тело) и версии модели и связанных
+    с ней моделей."""
+    versions = _versions((model, *related_models))
+    if request.user.is_staff:
+        # Персоналу видны черновики
+        scope = "staff"
+    elif request.user.is_authenticated:
+        scope = "user"
+    else:
+        scope = "anon"
+    url = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return (
+        f"response:{model._meta.label_lower}:{versions}:{scope}:"
+        f"{variant}:{url}"
+    )
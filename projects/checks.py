@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Кеш ответов сбрасывается версиями моделей в самом кеше: с locmem
+    записи воркера и команд не видны процессам web."""
+    if settings.DEBUG or settings.CACHE_BACKEND != "locmem":
+        return []
+    return [
+        Warning(
+            "CACHE_BACKEND=locmem: кеш свой в каждом процессе, и записи "
+            "из других процессов не сбрасывают закешированные ответы",
+            hint="Задайте CACHE_BACKEND=file или redis",
+            id="projects.W001",
+        )
+    ]
@@ -0,0 +1,112 @@
+"""Разделение чтения и записи между основной базой и репликой.
+
+На реплику уходят только чтения моделей приложения внутри
+``replica_reads()`` — этим блоком views из ``create_views`` оборачивают
+GET-запросы. Все остальное (запись, авторизация, регистрация, админка,
+команды) идет в основную базу.
+
+Реплика отстает от основной базы, поэтому после записи чтение
+закрепляется за основной базой: до конца запроса и, через cookie
+(см. ``ReplicaPinMiddleware``), на ``REPLICA_PIN_SECONDS`` секунд для
+следующих запросов того же клиента.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_replica_scope = ContextVar("replica_scope", default=False)
+# Клиент недавно писал (cookie) или запись уже была в этом запросе
+_pinned = ContextVar("replica_pinned", default=False)
+_wrote = ContextVar("replica_wrote", default=False)
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_scope.set(True)
+    try:
+        yield
+    finally:
+        _replica_scope.reset(token)
+
+
+def reads_from_replica():
+    """Можно ли сейчас читать с реплики (без учета того, настроена ли
+    она)."""
+    return _replica_scope.get() and not (_pinned.get() or _wrote.get())
+
+
+def pinned_to_primary():
+    """Чтения закреплены за основной базой после записи клиента.
+
+    Кешированные ответы, COUNT и валидаторы могли быть прочитаны
+    с отстающей реплики, поэтому в это время кеш чтений не используется
+    (см. ``projects.cache``).
+    """
+    return _pinned.get() or _wrote.get()
+
+
+class PrimaryReplicaRouter:
+    route_app_labels = {"projects"}
+
+    def db_for_read(self, model, **hints):
+        replica = settings.DATABASE_REPLICA
+        if (
+            replica
+            and model._meta.app_label in self.route_app_labels
+            and reads_from_replica()
+        ):
+            return replica
+        # Явно, иначе Django взял бы базу объекта из hints, и связи
+        # объекта, прочитанного с реплики, читались бы с нее же
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, settings.DATABASE_REPLICA} - {None}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплику вместе с данными
+        if db == settings.DATABASE_REPLICA:
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет чтения клиента за основной базой после записи.
+
+    Если во время запроса была запись, ответ ставит cookie на
+    ``REPLICA_PIN_SECONDS``; пока она есть, GET-запросы клиента не
+    читают с реплики и видят собственные изменения.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned_token = _pinned.set(
+            settings.REPLICA_PIN_COOKIE in request.COOKIES
+        )
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                response.set_cookie(
+                    settings.REPLICA_PIN_COOKIE,
+                    "1",
+                    max_age=settings.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite="Lax",
+                )
+            return response
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
@@ -0,0 +1,274 @@
+"""Потоковая перезапись HTML без построения DOM.
+
+Документ разбивается на токены регулярными выражениями, а преобразования
+(``Transform``) видят только открывающие теги и стек открытых элементов.
+Все, что преобразования не тронули, копируется в результат байт в байт,
+поэтому уже нормализованный HTML после перезаписи совпадает с тем,
+что давал BeautifulSoup.
+"""
+
+import html
+import re
+from urllib.parse import urlparse
+
+VOID_ELEMENTS = frozenset(
+    (
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "param",
+        "source",
+        "track",
+        "wbr",
+    )
+)
+# Содержимое этих элементов не разбирается на теги
+RAW_TEXT_ELEMENTS = frozenset(("script", "style"))
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<comment><!--.*?(?:-->|\Z))
+    |(?P<decl><[!?][^>]*>?)
+    |</(?P<end>[a-zA-Z][^\s/>]*)[^>]*>
+    |<(?P<start>[a-zA-Z][^\s/>]*)
+        (?P<attrs>(?:[^>"']|"[^"]*"|'[^']*')*?)
+        (?P<self_closing>/?)>
+    """,
+    re.S | re.X,
+)
+RAW_TEXT_END_RE = {
+    name: re.compile(rf"</{name}\s*>", re.I) for name in RAW_TEXT_ELEMENTS
+}
+ATTR_RE = re.compile(
+    r"""([^\s/>="'][^\s/>="']*)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]*))?"""
+)
+
+
+def is_absolute_url(url):
+    parsed_url = urlparse(url)
+    return bool(parsed_url.scheme) and bool(parsed_url.netloc)
+
+
+def quote_attr(value):
+    value = html.escape(value, quote=False)
+    if '"' not in value:
+        return f'"{value}"'
+    if "'" not in value:
+        return f"'{value}'"
+    return '"{}"'.format(value.replace('"', "&quot;"))
+
+
+def parse_attrs(raw_attrs):
+    attrs = []
+    for name, value in ATTR_RE.findall(raw_attrs):
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        attrs.append((name.lower(), html.unescape(value)))
+    return attrs
+
+
+class StartTag:
+    """Открывающий тег. Пока атрибуты не менялись, выводится как есть."""
+
+    __slots__ = ("name", "attrs", "raw", "self_closing", "changed", "closers")
+
+    def __init__(self, name, attrs, raw, self_closing):
+        self.name = name
+        self.attrs = attrs
+        self.raw = raw
+        self.self_closing = self_closing
+        self.changed = False
+        # Разметка, которую нужно вывести сразу после закрытия элемента
+        self.closers = []
+
+    def get(self, name, default=None):
+        for attr_name, value in self.attrs:
+            if attr_name == name:
+                return value
+        return default
+
+    def set(self, name, value):
+        self.changed = True
+        for index, (attr_name, _) in enumerate(self.attrs):
+            if attr_name == name:
+                self.attrs[index] = (name, value)
+                return
+        self.attrs.append((name, value))
+
+    def has_class(self, class_name):
+        return class_name in (self.get("class") or "").split()
+
+    def __str__(self):
+        if not self.changed:
+            return self.raw
+        # Измененный тег выводим так же, как BeautifulSoup
+        attrs = "".join(
+            f" {name}={quote_attr(value)}" for name, value in self.attrs
+        )
+        closing = "/" if self.self_closing else ""
+        return f"<{self.name}{attrs}{closing}>"
+
+
+class RewriteContext:
+    def __init__(self):
+        # Стек открытых элементов; пустые элементы в него не попадают
+        self.stack = []
+        self.before = []
+
+    @property
+    def parent(self):
+        return self.stack[-1] if self.stack else None
+
+    def insert_before(self, markup):
+        """Выводит разметку перед текущим тегом."""
+        self.before.append(markup)
+
+    def insert_after_close(self, element, markup):
+        """Выводит разметку сразу после закрывающего тега ``element``."""
+        element.closers.insert(0, markup)
+
+
+class Transform:
+    """Преобразование для ``HTMLRewriter``.
+
+    ``start_tag`` вызывается для каждого открывающего тега до того, как он
+    попадет в стек: ``context.parent`` — его родитель. По умолчанию тег
+    остается без изменений, поэтому подкласс переопределяет только нужные
+    ему хуки.
+    """
+
+    def start_tag(self, tag, context):
+        pass
+
+
+class AbsoluteImageSrc(Transform):
+    """Делает относительные ``src`` у ``<img>`` абсолютными."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def start_tag(self, tag, context):
+        if tag.name != "img":
+            return
+        src = tag.get("src")
+        if src is not None and not is_absolute_url(src):
+            tag.set("src", f"{self.base_url}/{src.lstrip('../')}")
+
+
+class WrapTables(Transform):
+    """Оборачивает ``<table>`` в ``<div class="custom-table-wrapper">``."""
+
+    wrapper_class = "custom-table-wrapper"
+
+    def start_tag(self, tag, context):
+        if tag.name != "table":
+            return
+        parent = context.parent
+        if (
+            parent
+            and parent.name == "div"
+            and parent.has_class(self.wrapper_class)
+        ):
+            return
+        context.insert_before(f'<div class="{self.wrapper_class}">')
+        context.insert_after_close(tag, "</div>")
+
+
+def tokenize(markup):
+    """Разбивает HTML на токены ``(вид, текст, match)`` за один проход."""
+    position = 0
+    length = len(markup)
+    while position < length:
+        match = TOKEN_RE.search(markup, position)
+        if match is None:
+            yield "text", markup[position:], None
+            return
+        token_start, token_end = match.span()
+        if token_start > position:
+            yield "text", markup[position:token_start], None
+
+        if match.group("start"):
+            yield "start", match.group(), match
+            name = match.group("start").lower()
+            if name in RAW_TEXT_ELEMENTS and not match.group("self_closing"):
+                # Текст скрипта или стиля до закрывающего тега
+                end = RAW_TEXT_END_RE[name].search(markup, token_end)
+                raw_end = end.start() if end else length
+                if raw_end > token_end:
+                    yield "text", markup[token_end:raw_end], None
+                position = raw_end
+                continue
+        elif match.group("end"):
+            yield "end", match.group(), match
+        else:
+            yield "text", match.group(), None
+        position = token_end
+
+
+class HTMLRewriter:
+    """Применяет цепочку преобразований к HTML за один проход."""
+
+    def __init__(self, transforms):
+        self.transforms = transforms
+
+    def rewrite(self, markup):
+        if not markup:
+            return markup
+        return "".join(self.iter_rewrite(markup))
+
+    def iter_rewrite(self, markup):
+        context = RewriteContext()
+        stack = context.stack
+
+        for kind, raw, match in tokenize(markup):
+            if kind == "text":
+                yield raw
+            elif kind == "start":
+                name = match.group("start").lower()
+                tag = StartTag(
+                    name,
+                    parse_attrs(match.group("attrs")),
+                    raw,
+                    bool(match.group("self_closing")),
+                )
+                for transform in self.transforms:
+                    transform.start_tag(tag, context)
+                if context.before:
+                    yield from context.before
+                    context.before.clear()
+                yield str(tag)
+
+                if tag.self_closing or name in VOID_ELEMENTS:
+                    yield from tag.closers
+                else:
+                    stack.append(tag)
+            else:
+                name = match.group("end").lower()
+                if not any(element.name == name for element in stack):
+                    # Закрывающий тег без пары выводим как есть
+                    yield raw
+                    continue
+                # Элементы, закрытые неявно, закрываются до этого тега
+                while stack[-1].name != name:
+                    yield from stack.pop().closers
+                yield raw
+                yield from stack.pop().closers
+
+        while stack:
+            yield from stack.pop().closers
+
+
+def iter_img_srcs(markup):
+    """Значения ``src`` всех ``<img>`` документа."""
+    for kind, _, match in tokenize(markup or ""):
+        if kind == "start" and match.group("start").lower() == "img":
+            src = dict(parse_attrs(match.group("attrs"))).get("src")
+            if src:
+                yield src
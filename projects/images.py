@@ -0,0 +1,325 @@
+import base64
+import io
+import os
+
+from PIL import Image as PilImage
+
+from .storage import is_content_addressed
+
+# Каталог внутри MEDIA_ROOT, куда складываются оптимизированные изображения
+IMAGES_DIR = "images"
+
+JPEG_QUALITY = 80
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+
+# Параметры сохранения для каждого формата производных
+FORMAT_OPTIONS = {
+    "avif": {"format": "AVIF", "quality": AVIF_QUALITY},
+    "webp": {"format": "WEBP", "quality": WEBP_QUALITY},
+    "jpeg": {
+        "format": "JPEG",
+        "quality": JPEG_QUALITY,
+        "optimize": True,
+        "progressive": True,
+    },
+}
+# Суффикс .opt у всех форматов: исходник может сам быть WebP или AVIF,
+# и производная с тем же именем перезаписала бы его
+FORMAT_EXTENSIONS = {"avif": "opt.avif", "webp": "opt.webp", "jpeg": "opt.jpg"}
+# Расширения файлов, загруженных в форматах производных
+EXTENSION_FORMATS = {
+    ".avif": "avif",
+    ".webp": "webp",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+}
+FORMAT_MIME_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+# Порядок предпочтения: от самого компактного формата к самому совместимому
+FORMAT_PREFERENCE = ("avif", "webp", "jpeg")
+# Полноразмерные производные, которые нужны всегда (поля image и *_webp)
+REQUIRED_FORMATS = ("webp", "jpeg")
+
+# Размер (по длинной стороне) и качество размытой заглушки LQIP
+LQIP_SIZE = 16
+LQIP_QUALITY = 50
+
+
+def _avif_supported():
+    # Колеса Pillow собраны с libavif начиная с 11.3 (requirements.txt),
+    # для более старых версий AVIF добавляет пакет pillow-avif-plugin
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+    PilImage.init()
+    return "AVIF" in PilImage.SAVE
+
+
+SUPPORTED_FORMATS = tuple(
+    fmt for fmt in FORMAT_PREFERENCE if fmt != "avif" or _avif_supported()
+)
+
+
+def _save_atomic(pil_image, path, **params):
+    # Пишем во временный файл и подменяем целевой, чтобы читатели
+    # никогда не видели недописанное изображение
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pil_image.save(tmp_path, **params)
+    os.replace(tmp_path, path)
+
+
+def _derivative_base(source):
+    # Для файлов, адресованных по содержимому, производные лежат рядом
+    # с исходником и однозначно определяются его хешем
+    if is_content_addressed(source):
+        return os.path.splitext(source)[0]
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(IMAGES_DIR, stem)
+
+
+def derivative_names(source, formats=REQUIRED_FORMATS):
+    """Имена полноразмерных производных относительно MEDIA_ROOT."""
+    base = _derivative_base(source)
+    return {
+        fmt: f"{base}.{FORMAT_EXTENSIONS[fmt]}"
+        for fmt in FORMAT_PREFERENCE
+        if fmt in formats or fmt in REQUIRED_FORMATS
+    }
+
+
+def format_of(name):
+    """Формат файла по расширению; None для форматов, которые не входят
+    в ``FORMAT_PREFERENCE`` (PNG, GIF)."""
+    return EXTENSION_FORMATS.get(os.path.splitext(name or "")[1].lower())
+
+
+def variant_name(source, fmt, width):
+    base = _derivative_base(source)
+    return f"{base}.w{width}.{FORMAT_EXTENSIONS[fmt]}"
+
+
+def variant_widths(size, widths):
+    """Ширины лестницы, меньшие исходной: изображения не увеличиваем."""
+    return sorted(width for width in set(widths) if width < size[0])
+
+
+class ImageTooLarge(ValueError):
+    """Изображение превышает допустимый бюджет пикселей."""
+
+
+def bounded_size(size, max_dimension):
+    """Размер после вписывания в квадрат ``max_dimension``."""
+    width, height = size
+    if not max_dimension or max(width, height) <= max_dimension:
+        return size
+    scale = max_dimension / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def snap_to_steps(value, steps):
+    """Округляет размер вверх до ближайшей ступени (0 — без ограничения
+    по этой стороне)."""
+    if not value:
+        return 0
+    return min((step for step in steps if step >= value), default=max(steps))
+
+
+def decode_bounded(pil_image, max_dimension=None, max_pixels=None):
+    """Декодирует изображение, ограничивая пиковое потребление памяти.
+
+    Бюджет пикселей проверяется по заголовку, до декодирования. Для JPEG
+    включается draft-режим: декодер сразу масштабирует в 2/4/8 раз
+    и полноразмерный буфер не создается. Возвращает
+    единственный RGB/L-буфер, из которого строятся все форматы.
+    """
+    width, height = pil_image.size
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLarge(
+            f"{width}x{height} больше бюджета в {max_pixels} пикселей"
+        )
+
+    target = bounded_size(pil_image.size, max_dimension)
+    if target != pil_image.size:
+        # draft() сразу меняет размер, до которого декодируется JPEG
+        pil_image.draft(None, (target[0] * 2, target[1] * 2))
+        pil_image = pil_image.resize(
+            target, PilImage.LANCZOS, reducing_gap=2.0
+        )
+    else:
+        pil_image.load()
+
+    # JPEG не поддерживает прозрачность и палитру
+    if pil_image.mode not in ("RGB", "L"):
+        pil_image = pil_image.convert("RGB")
+    return pil_image
+
+
+def render_derivatives(
+    media_root,
+    source,
+    widths=(),
+    formats=("webp",),
+    max_dimension=None,
+    max_pixels=None,
+):
+    """Сжимает исходное изображение в JPEG, создает WebP и набор ширин.
+
+    Функция не обращается к ORM, поэтому её можно выполнять в отдельном
+    процессе. Изображение декодируется один раз (см. ``decode_bounded``).
+    Возвращает имена файлов относительно MEDIA_ROOT и список вариантов
+    ``{"format", "width", "height", "name"}``.
+    """
+    formats = [fmt for fmt in formats if fmt in SUPPORTED_FORMATS]
+    names = derivative_names(source, formats)
+
+    # PIL читает только заголовок, пиксели декодируются при load()
+    with PilImage.open(os.path.join(media_root, source)) as pil_image:
+        width, height = bounded_size(pil_image.size, max_dimension)
+        variants = [
+            {
+                "format": fmt,
+                "width": variant_width,
+                "height": max(1, round(height * variant_width / width)),
+                "name": variant_name(source, fmt, variant_width),
+            }
+            for variant_width in variant_widths((width, height), widths)
+            for fmt in formats
+        ]
+        result = {**names, "width": width, "variants": variants}
+
+        outputs = list(names.values()) + [v["name"] for v in variants]
+        if source in outputs:
+            raise ValueError(f"Производная {source} перезаписала бы исходник")
+
+        # Производные этого содержимого уже созданы для другого объекта:
+        # заглушку считаем по готовому JPEG, декодируя его в draft-режиме
+        if is_content_addressed(source) and all(
+            os.path.exists(os.path.join(media_root, name)) for name in outputs
+        ):
+            with PilImage.open(
+                os.path.join(media_root, names["jpeg"])
+            ) as derivative:
+                result["meta"] = image_meta(
+                    (width, height), decode_bounded(derivative, LQIP_SIZE * 8)
+                )
+            return result
+
+        os.makedirs(
+            os.path.dirname(os.path.join(media_root, names["jpeg"])),
+            exist_ok=True,
+        )
+
+        pil_image = decode_bounded(pil_image, max_dimension, max_pixels)
+        result["meta"] = image_meta(pil_image.size, pil_image)
+
+        for fmt, name in names.items():
+            _save_atomic(
+                pil_image,
+                os.path.join(media_root, name),
+                **FORMAT_OPTIONS[fmt],
+            )
+
+        for variant in variants:
+            resized = pil_image.resize(
+                (variant["width"], variant["height"]),
+                PilImage.LANCZOS,
+                reducing_gap=3.0,
+            )
+            _save_atomic(
+                resized,
+                os.path.join(media_root, variant["name"]),
+                **FORMAT_OPTIONS[variant["format"]],
+            )
+
+    return result
+
+
+def image_meta(size, pil_image):
+    """Размеры, преобладающий цвет и LQIP-заглушка для резервирования
+    места под изображение до его загрузки."""
+    small = pil_image.convert("RGB")
+    small.thumbnail((LQIP_SIZE * 4, LQIP_SIZE * 4))
+
+    # Преобладающий цвет — самый частый цвет палитры из пяти
+    palette_image = small.quantize(colors=5).convert("RGB")
+    _, (red, green, blue) = max(palette_image.getcolors())
+
+    small.thumbnail((LQIP_SIZE, LQIP_SIZE))
+    buffer = io.BytesIO()
+    small.save(buffer, format="JPEG", quality=LQIP_QUALITY)
+    lqip = base64.b64encode(buffer.getvalue()).decode()
+
+    return {
+        "width": size[0],
+        "height": size[1],
+        "color": f"#{red:02x}{green:02x}{blue:02x}",
+        "lqip": f"data:image/jpeg;base64,{lqip}",
+    }
+
+
+def srcset_manifest(result):
+    """Компактный манифест ``{формат: [[ширина, имя], ...]}`` по ширинам.
+
+    Последним элементом идет полноразмерная производная.
+    """
+    manifest = {}
+    for fmt in FORMAT_PREFERENCE:
+        if fmt not in result:
+            continue
+        manifest[fmt] = [
+            [variant["width"], variant["name"]]
+            for variant in result["variants"]
+            if variant["format"] == fmt
+        ] + [[result["width"], result[fmt]]]
+    return manifest
+
+
+def accepted_mime_types(accept):
+    """MIME-типы из заголовка Accept, кроме явно запрещенных ``q=0``."""
+    mime_types = set()
+    for media_range in (accept or "").split(","):
+        mime_type, *params = media_range.split(";")
+        rejected = False
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    rejected = float(value) == 0
+                except ValueError:
+                    pass
+        if not rejected:
+            mime_types.add(mime_type.strip().lower())
+    return mime_types
+
+
+def negotiate_format(accept, available=SUPPORTED_FORMATS):
+    """Выбирает самый компактный из доступных форматов, который понимает
+    клиент. JPEG считается поддерживаемым всегда."""
+    mime_types = accepted_mime_types(accept)
+    for fmt in FORMAT_PREFERENCE:
+        if fmt in available and FORMAT_MIME_TYPES[fmt] in mime_types:
+            return fmt
+    if "jpeg" in available:
+        return "jpeg"
+    return next(fmt for fmt in FORMAT_PREFERENCE if fmt in available)
+
+
+def render_resized(source_path, target_path, size, fmt, max_pixels=None):
+    """Вписывает изображение в ``size`` (0 — без ограничения) без увеличения.
+
+    Как и ``render_derivatives``, не обращается к ORM.
+    """
+    with PilImage.open(source_path) as pil_image:
+        scale = min(
+            (size[0] or pil_image.width) / pil_image.width,
+            (size[1] or pil_image.height) / pil_image.height,
+            1,
+        )
+        max_dimension = max(1, round(max(pil_image.size) * scale))
+        pil_image = decode_bounded(pil_image, max_dimension, max_pixels)
+        _save_atomic(pil_image, target_path, **FORMAT_OPTIONS[fmt])
@@ -0,0 +1,141 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from projects.models import Article, ArticleCategory, Initiative, Project
+
+PAGE_SIZE = 20
+
+# Статья из TinyMCE с таблицами и блоками редактора
+DETAIL_TEXT = (
+    "<h2>Раздел</h2><p>Текст статьи <strong>с выделением</strong>.</p>"
+    '<p><img src="https://example.com/media/images/photo.jpg" alt=""></p>'
+    "<table><tr><td>Ячейка</td><td>Ячейка</td></tr></table>"
+)
+JSON_BLOCK = {"type": "paragraph", "data": {"text": "Блок редактора " * 20}}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает время и память чтения статей с тяжелыми полями "
+        "(detail_text, json_blocks) и без них. Данные создаются "
+        "в откатываемой транзакции"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--articles", type=int, default=2000, help="Сколько статей"
+        )
+        parser.add_argument(
+            "--detail-kb",
+            type=int,
+            default=50,
+            help="Размер detail_text одной статьи, КБ",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=10, help="Повторов каждого замера"
+        )
+        parser.add_argument(
+            "--output",
+            help="Записать результаты в JSON для сравнения между запусками",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options)
+                results = self.run_benchmarks(options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        for result in results:
+            self.stdout.write(
+                f"{result['name']:<40} медиана {result['median_ms']:8.2f} мс, "
+                f"пик памяти {result['peak_kb']:9.0f} КБ"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {"vendor": connection.vendor, "results": results},
+                    output,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+
+    def seed(self, options):
+        user = User.objects.create(username="bench-detail-tables")
+        project = Project.objects.create(title="bench", user=user)
+        initiative = Initiative.objects.create(
+            title="bench", project_id=project
+        )
+        category = ArticleCategory.objects.create(title="bench")
+        repeats = options["detail_kb"] * 1024 // len(DETAIL_TEXT.encode())
+        detail_text = DETAIL_TEXT * max(repeats, 1)
+        json_blocks = {"blocks": [JSON_BLOCK] * 20}
+        # Через save(): он создает строки таблицы деталей
+        for index in range(options["articles"]):
+            Article.objects.create(
+                title=f"Статья {index}",
+                initiative_id=initiative,
+                cat_id=category,
+                detail_text=detail_text,
+                json_blocks=json_blocks,
+            )
+        with connection.cursor() as cursor:
+            if connection.vendor in ("sqlite", "postgresql"):
+                cursor.execute("ANALYZE")
+
+    def benchmarks(self):
+        # "До" — те же объекты вместе с деталями: столько байт читалось,
+        # пока тяжелые поля лежали в строке статьи
+        before = Article.objects.select_related("detail")
+        after = Article.objects.all()
+        page = slice(0, PAGE_SIZE)
+        return [
+            (
+                "Страница списка, с деталями (до)",
+                before.order_by("time_create", "id")[page],
+            ),
+            (
+                "Страница списка, без деталей (после)",
+                after.order_by("time_create", "id")[page],
+            ),
+            ("Все статьи, с деталями (до)", before),
+            ("Все статьи, без деталей (после)", after),
+        ]
+
+    def run_benchmarks(self, repeat):
+        results = []
+        for name, queryset in self.benchmarks():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+
+            tracemalloc.start()
+            list(queryset.all())
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            timings.sort()
+            results.append(
+                {
+                    "name": name,
+                    "median_ms": statistics.median(timings),
+                    "p95_ms": timings[max(int(len(timings) * 0.95) - 1, 0)],
+                    "peak_kb": peak / 1024,
+                }
+            )
+        return results
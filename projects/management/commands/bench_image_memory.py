@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image as PilImage
+
+from projects.images import render_derivatives
+
+SOURCE_NAME = "source.jpg"
+
+
+def _make_source(media_root, megapixels):
+    # Шумная картинка, чтобы JPEG получился реалистичного размера
+    side = int((megapixels * 1_000_000) ** 0.5)
+    size = (side * 4 // 3, side * 3 // 4)
+    tile = PilImage.effect_noise((512, 512), 64).convert("RGB")
+    pil_image = PilImage.new("RGB", size)
+    for x in range(0, size[0], tile.width):
+        for y in range(0, size[1], tile.height):
+            pil_image.paste(tile, (x, y))
+    pil_image.save(os.path.join(media_root, SOURCE_NAME), quality=90)
+
+
+def _legacy_render(media_root):
+    # Прежний путь из ImageOptimizationMixin: полное декодирование,
+    # сохранение JPEG и повторное декодирование записанного файла для WebP
+    jpeg_path = os.path.join(media_root, "legacy.jpg")
+    pil_image = PilImage.open(os.path.join(media_root, SOURCE_NAME))
+    if pil_image.mode == "RGBA":
+        pil_image = pil_image.convert("RGB")
+    pil_image.save(jpeg_path, format="JPEG", quality=80, optimize=True)
+    pil_image = PilImage.open(jpeg_path)
+    pil_image.save(
+        os.path.join(media_root, "legacy.webp"), format="webp", quality=80
+    )
+
+
+def _bounded_render(media_root, options):
+    render_derivatives(media_root, SOURCE_NAME, **options)
+
+
+def _measure(queue, target, args):
+    started = time.perf_counter()
+    target(*args)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss в Linux возвращается в килобайтах
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((peak_rss, elapsed))
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пиковую память (RSS) и время обработки большого "
+        "изображения: прежний путь и декодирование с ограничениями"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--megapixels",
+            type=int,
+            default=50,
+            help="Размер тестового JPEG в мегапикселях",
+        )
+
+    def handle(self, *args, **options):
+        # Каждый замер — в отдельном чистом процессе, чтобы пик RSS
+        # одного прогона не влиял на другой
+        context = multiprocessing.get_context("spawn")
+        media_root = tempfile.mkdtemp()
+        try:
+            self.run(context, _make_source, media_root, options["megapixels"])
+            bounded_options = {
+                "widths": settings.IMAGE_VARIANT_WIDTHS,
+                "formats": settings.IMAGE_VARIANT_FORMATS,
+                "max_dimension": settings.IMAGE_MAX_DIMENSION,
+            }
+            results = (
+                (
+                    "до (полное декодирование x2)",
+                    self.run(context, _legacy_render, media_root),
+                ),
+                (
+                    "после (draft + один буфер)",
+                    self.run(
+                        context, _bounded_render, media_root, bounded_options
+                    ),
+                ),
+            )
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.stdout.write(f"Исходник: {options['megapixels']} Мп")
+        for label, (peak_rss, elapsed) in results:
+            self.stdout.write(
+                f"{label}: пик RSS {peak_rss / 1024:.1f} МБ, "
+                f"{elapsed:.2f} с"
+            )
+
+    def run(self, context, target, *args):
+        queue = context.Queue()
+        process = context.Process(target=_measure, args=(queue, target, args))
+        process.start()
+        result = queue.get()
+        process.join()
+        return result
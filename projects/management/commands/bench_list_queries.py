@@ -0,0 +1,198 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from projects.models import Article, ArticleCategory, Initiative, Project
+
+PAGE_SIZE = 20
+
+
+class Rollback(Exception):
+    pass
+
+
+def list_queryset(model_class, **filters):
+    # Тот же запрос, что строит ListCreateView из create_views
+    return model_class.objects.filter(is_published=True, **filters).order_by(
+        "time_create", "id"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет таблицы тестовыми данными в откатываемой транзакции, "
+        "снимает EXPLAIN и время запросов списков API"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--projects", type=int, default=1000, help="Сколько проектов"
+        )
+        parser.add_argument(
+            "--initiatives",
+            type=int,
+            default=10,
+            help="Сколько инициатив на проект",
+        )
+        parser.add_argument(
+            "--articles",
+            type=int,
+            default=10,
+            help="Сколько статей на инициативу",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=20, help="Повторов каждого запроса"
+        )
+        parser.add_argument(
+            "--output",
+            help="Записать результаты в JSON для сравнения между запусками",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options)
+                results = self.run_queries(options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        for result in results:
+            self.stdout.write(
+                f"\n{result['name']}: медиана {result['median_ms']:.2f} мс, "
+                f"p95 {result['p95_ms']:.2f} мс"
+            )
+            self.stdout.write(result["plan"])
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(
+                    {"vendor": connection.vendor, "results": results},
+                    output,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+
+    def seed(self, options):
+        user = User.objects.create(username="bench-list-queries")
+        category = ArticleCategory.objects.create(title="bench")
+        Project.objects.bulk_create(
+            (
+                Project(title=f"Проект {index}", user=user)
+                for index in range(options["projects"])
+            ),
+            batch_size=1000,
+        )
+        project_ids = Project.objects.filter(user=user).values_list(
+            "id", flat=True
+        )
+        Initiative.objects.bulk_create(
+            (
+                Initiative(
+                    title=f"Инициатива {index}",
+                    project_id_id=project_id,
+                    # Часть записей — черновики, как в реальных данных
+                    is_published=index % 10 != 0,
+                )
+                for project_id in project_ids
+                for index in range(options["initiatives"])
+            ),
+            batch_size=1000,
+        )
+        initiatives = Initiative.objects.filter(
+            project_id__user=user
+        ).values_list("id", "project_id")
+        # bulk_create обходит save() и сигналы: project_id задаем сами,
+        # счетчики в этом замере не читаются
+        Article.objects.bulk_create(
+            (
+                Article(
+                    title=f"Статья {index}",
+                    initiative_id_id=initiative_id,
+                    project_id_id=project_id,
+                    cat_id=category,
+                    is_published=index % 10 != 0,
+                )
+                for initiative_id, project_id in initiatives
+                for index in range(options["articles"])
+            ),
+            batch_size=1000,
+        )
+        self.category = category
+        self.initiative_id, self.project_id = initiatives.last()
+        self.stdout.write(
+            f"Строк: проекты {Project.objects.count()}, "
+            f"инициативы {Initiative.objects.count()}, "
+            f"статьи {Article.objects.count()}"
+        )
+        with connection.cursor() as cursor:
+            if connection.vendor in ("sqlite", "postgresql"):
+                # Статистика для планировщика после массовой вставки
+                cursor.execute("ANALYZE")
+
+    def queries(self):
+        articles = list_queryset(Article)
+        deep_offset = max(articles.count() - PAGE_SIZE, 1)
+        deep_end = deep_offset + PAGE_SIZE
+        # Курсор последней страницы — строка перед ней
+        cursor = articles.values("time_create", "id")[deep_offset - 1]
+        return [
+            ("Статьи, первая страница", articles[:PAGE_SIZE]),
+            (
+                "Статьи, последняя страница (OFFSET)",
+                articles[deep_offset:deep_end],
+            ),
+            (
+                "Статьи, последняя страница (курсор)",
+                # Условие как в CustomPagination
+                articles.filter(
+                    Q(time_create__gte=cursor["time_create"]),
+                    Q(time_create__gt=cursor["time_create"])
+                    | Q(id__gt=cursor["id"]),
+                )[:PAGE_SIZE],
+            ),
+            (
+                "Статьи инициативы",
+                list_queryset(Article, initiative_id=self.initiative_id)[
+                    :PAGE_SIZE
+                ],
+            ),
+            (
+                "Статьи проекта",
+                list_queryset(Article, project_id=self.project_id)[:PAGE_SIZE],
+            ),
+            (
+                "Статьи категории",
+                list_queryset(Article, cat_id=self.category)[:PAGE_SIZE],
+            ),
+            (
+                "Инициативы, первая страница",
+                list_queryset(Initiative)[:PAGE_SIZE],
+            ),
+            ("Проекты, первая страница", list_queryset(Project)[:PAGE_SIZE]),
+        ]
+
+    def run_queries(self, repeat):
+        results = []
+        for name, queryset in self.queries():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            results.append(
+                {
+                    "name": name,
+                    "sql": str(queryset.query),
+                    "plan": queryset.explain(),
+                    "median_ms": statistics.median(timings),
+                    "p95_ms": timings[max(int(len(timings) * 0.95) - 1, 0)],
+                }
+            )
+        return results
@@ -0,0 +1,200 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+ROWS = 20000
+BODY = "Текст статьи. " * 150
+
+# Запросы, похожие на запросы API: страница списка, деталь и сохранение
+LIST_SQL = (
+    "SELECT id, title, time_create FROM article WHERE is_published "
+    "ORDER BY time_create, id LIMIT 20 OFFSET ?"
+)
+DETAIL_SQL = "SELECT id, title, body, time_update FROM article WHERE id = ?"
+UPDATE_SQL = "UPDATE article SET title = ?, time_update = ? WHERE id = ?"
+INSERT_SQL = (
+    "INSERT INTO article (title, body, is_published, time_create, "
+    "time_update) VALUES (?, ?, 1, ?, ?)"
+)
+
+
+def connect(path, pragmas, timeout):
+    # isolation_level=None: транзакциями управляем явно, как Django
+    connection = sqlite3.connect(
+        path,
+        timeout=timeout,
+        isolation_level=None,
+        check_same_thread=False,
+    )
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name}={value}")
+    return connection
+
+
+def create_database(path, pragmas):
+    connection = connect(path, pragmas, timeout=5)
+    connection.execute(
+        "CREATE TABLE article (id INTEGER PRIMARY KEY, title TEXT, "
+        "body TEXT, is_published BOOL, time_create REAL, time_update REAL)"
+    )
+    connection.execute(
+        "CREATE INDEX article_list ON article (time_create, id) "
+        "WHERE is_published"
+    )
+    now = time.time()
+    connection.execute("BEGIN")
+    connection.executemany(
+        INSERT_SQL,
+        (
+            (f"Статья {index}", BODY, now + index, now + index)
+            for index in range(ROWS)
+        ),
+    )
+    connection.execute("COMMIT")
+    connection.close()
+
+
+class Worker(threading.Thread):
+    def __init__(self, profile, deadline, persistent):
+        super().__init__(daemon=True)
+        self.profile = profile
+        self.deadline = deadline
+        self.persistent = persistent
+        self.operations = 0
+        self.errors = 0
+        self.random = random.Random()
+
+    def run(self):
+        connection = None
+        while time.perf_counter() < self.deadline:
+            if connection is None:
+                connection = connect(**self.profile)
+            try:
+                self.operation(connection)
+                self.operations += 1
+            except sqlite3.OperationalError:
+                # "database is locked": запрос API ответил бы ошибкой 500
+                self.errors += 1
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+            if not self.persistent:
+                connection.close()
+                connection = None
+        if connection is not None:
+            connection.close()
+
+
+class Reader(Worker):
+    def operation(self, connection):
+        if self.random.random() < 0.5:
+            offset = self.random.randrange(ROWS // 20) * 20
+            connection.execute(LIST_SQL, (offset,)).fetchall()
+        else:
+            pk = self.random.randrange(1, ROWS + 1)
+            connection.execute(DETAIL_SQL, (pk,)).fetchall()
+
+
+class Writer(Worker):
+    def __init__(self, profile, deadline, persistent, begin):
+        super().__init__(profile, deadline, persistent)
+        self.begin = begin
+
+    def operation(self, connection):
+        now = time.time()
+        connection.execute(self.begin)
+        # Как сохранение в админке: чтение, затем запись в одной транзакции
+        pk = self.random.randrange(1, ROWS + 1)
+        connection.execute(DETAIL_SQL, (pk,)).fetchall()
+        connection.execute(UPDATE_SQL, (f"Статья {now}", now, pk))
+        connection.execute(INSERT_SQL, ("Новая статья", BODY, now, now))
+        connection.execute("COMMIT")
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест SQLite: параллельные читатели и писатели на "
+        "временной базе с настройками по умолчанию и с продакшен-профилем "
+        "(SQLITE_PRAGMAS), сравнение пропускной способности"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--readers", type=int, default=8, help="Потоков чтения"
+        )
+        parser.add_argument(
+            "--writers", type=int, default=2, help="Потоков записи"
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=5,
+            help="Длительность каждого прогона, секунды",
+        )
+        parser.add_argument(
+            "--output",
+            help="Записать результаты в JSON для сравнения между запусками",
+        )
+
+    def handle(self, *args, **options):
+        busy_timeout = settings.SQLITE_PRAGMAS["busy_timeout"]
+        profiles = [
+            # Как было: журнал отката, новое соединение на каждый запрос,
+            # отложенные транзакции
+            ("по умолчанию", {}, 5, False, "BEGIN"),
+            (
+                "продакшен",
+                settings.SQLITE_PRAGMAS,
+                busy_timeout / 1000,
+                True,
+                "BEGIN IMMEDIATE",
+            ),
+        ]
+        results = []
+        for label, pragmas, timeout, persistent, begin in profiles:
+            result = self.run_profile(
+                pragmas, timeout, persistent, begin, options
+            )
+            result["profile"] = label
+            results.append(result)
+            self.stdout.write(
+                f"{label:>13}: чтений {result['reads_per_second']:9.0f}/с, "
+                f"записей {result['writes_per_second']:7.0f}/с, "
+                f"ошибок блокировки {result['errors']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def run_profile(self, pragmas, timeout, persistent, begin, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.sqlite3")
+            create_database(path, pragmas)
+            profile = {"path": path, "pragmas": pragmas, "timeout": timeout}
+            deadline = time.perf_counter() + options["duration"]
+            readers = [
+                Reader(profile, deadline, persistent)
+                for _ in range(options["readers"])
+            ]
+            writers = [
+                Writer(profile, deadline, persistent, begin)
+                for _ in range(options["writers"])
+            ]
+            for worker in readers + writers:
+                worker.start()
+            for worker in readers + writers:
+                worker.join()
+
+        duration = options["duration"]
+        return {
+            "reads_per_second": sum(w.operations for w in readers) / duration,
+            "writes_per_second": sum(w.operations for w in writers) / duration,
+            "errors": sum(w.errors for w in readers + writers),
+        }
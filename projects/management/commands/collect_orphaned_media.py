@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+import time
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from projects.html_rewriter import iter_img_srcs
+from projects.images import derivative_names
+from projects.models import (
+    Article,
+    ImageDerivative,
+    ImageJob,
+    Initiative,
+    Project,
+)
+from projects.storage import is_content_addressed
+
+CONTENT_MODELS = (Project, Initiative, Article)
+
+STATE_FILE = ".media_gc.json"
+QUARANTINE_DIR = ".quarantine"
+
+
+def media_name(src):
+    """Имя файла в MEDIA_ROOT по значению ``src`` или None для чужих URL."""
+    path = unquote(urlparse(src).path)
+    _, found, name = path.partition(settings.MEDIA_URL)
+    return name if found else None
+
+
+class ReferenceIndex:
+    """Множество имен файлов, на которые ссылается БД.
+
+    Для файлов с адресацией по содержимому достаточно хеша: все
+    производные (``<hash>.webp``, ``<hash>.w640.avif``, ...) считаются
+    используемыми, пока используется хотя бы один файл с этим хешем.
+    """
+
+    def __init__(self):
+        self.names = set()
+        self.hashes = set()
+
+    def add(self, name):
+        if not name:
+            return
+        if is_content_addressed(name):
+            self.hashes.add(os.path.basename(name).split(".", 1)[0])
+        else:
+            self.names.add(name)
+            self.names.update(derivative_names(name).values())
+
+    def __contains__(self, name):
+        if is_content_addressed(name):
+            return os.path.basename(name).split(".", 1)[0] in self.hashes
+        return name in self.names
+
+    @classmethod
+    def build(cls):
+        index = cls()
+        for model_class in CONTENT_MODELS:
+            file_fields = [
+                field.name
+                for field in model_class._meta.fields
+                if field.get_internal_type() in ("FileField", "ImageField")
+            ]
+            rows = model_class.objects.values_list(
+                "detail__detail_text", "srcset", *file_fields
+            )
+            for detail_text, srcset, *names in rows.iterator():
+                for name in names:
+                    index.add(name)
+                for formats in (srcset or {}).values():
+                    for entries in formats.values():
+                        for _, name in entries:
+                            index.add(name)
+                for src in iter_img_srcs(detail_text):
+                    index.add(media_name(src))
+
+        # Исходники заданий, которые воркер еще не обработал
+        for name in ImageJob.objects.values_list("source", flat=True):
+            index.add(name)
+
+        # Варианты исходников без адресации по содержимому
+        for original, name in ImageDerivative.objects.values_list(
+            "original", "name"
+        ).iterator():
+            if original in index:
+                index.add(name)
+        return index
+
+
+def iter_media_files(root, start_after=""):
+    """Обходит файлы MEDIA_ROOT в стабильном порядке после ``start_after``.
+
+    Каталоги, целиком лежащие до курсора, пропускаются без чтения, поэтому
+    продолжение обхода не сканирует уже пройденную часть дерева.
+    """
+    cursor = tuple(start_after.split("/")) if start_after else ()
+
+    def walk(directory, prefix):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            parts = prefix + (entry.name,)
+            if entry.name.startswith("."):
+                # Служебные файлы и карантин
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if parts < cursor[: len(parts)]:
+                    continue
+                yield from walk(entry.path, parts)
+            elif parts > cursor:
+                yield "/".join(parts), entry
+
+    yield from walk(root, ())
+
+
+class Command(BaseCommand):
+    help = (
+        "Находит в MEDIA_ROOT файлы, на которые не ссылается ни один объект, "
+        "и переносит их в карантин или удаляет. Обход инкрементальный: "
+        "каждый запуск продолжает с места, где остановился предыдущий"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=10000,
+            help="Сколько файлов проверить за один запуск",
+        )
+        parser.add_argument(
+            "--grace-hours",
+            type=float,
+            default=24,
+            help=(
+                "Не трогать файлы моложе указанного возраста: загрузки "
+                "из редактора появляются раньше, чем сохраняется текст"
+            ),
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Удалять файлы вместо переноса в карантин",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать найденные файлы",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Начать обход сначала, сбросив сохраненный курсор",
+        )
+
+    def handle(self, *args, **options):
+        root = settings.MEDIA_ROOT
+        state_path = os.path.join(root, STATE_FILE)
+        state = {} if options["restart"] else self.load_state(state_path)
+        cursor = state.get("cursor", "")
+
+        index = ReferenceIndex.build()
+        excluded = self.excluded_prefixes(root)
+        newest_allowed = time.time() - options["grace_hours"] * 3600
+
+        checked = 0
+        removed = []
+        last_name = None
+        for name, entry in iter_media_files(root, cursor):
+            if checked >= options["limit"]:
+                break
+            checked += 1
+            last_name = name
+
+            if name.startswith(excluded) or name in index:
+                continue
+            if entry.stat().st_mtime > newest_allowed:
+                continue
+
+            removed.append(name)
+            if options["dry_run"]:
+                self.stdout.write(name)
+            else:
+                self.remove(root, name, options["delete"])
+        else:
+            # Дошли до конца дерева: следующий запуск начнет сначала
+            last_name = ""
+
+        if not options["dry_run"]:
+            ImageDerivative.objects.filter(name__in=removed).delete()
+            self.save_state(state_path, {"cursor": last_name})
+
+        action = "найдено" if options["dry_run"] else "убрано"
+        position = f"курсор: {last_name}" if last_name else "обход завершен"
+        self.stdout.write(
+            f"Проверено файлов: {checked}, {action}: {len(removed)}, "
+            f"{position}"
+        )
+
+    def excluded_prefixes(self, root):
+        # Дисковый кеш ресайза, если он лежит внутри MEDIA_ROOT
+        cache_dir = os.path.relpath(settings.RESIZE_CACHE_DIR, root)
+        if cache_dir.startswith(".."):
+            return ()
+        return (cache_dir.replace(os.sep, "/") + "/",)
+
+    def remove(self, root, name, delete):
+        path = os.path.join(root, name)
+        if delete:
+            os.remove(path)
+            return
+        target = os.path.join(root, QUARANTINE_DIR, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+
+    @staticmethod
+    def load_state(path):
+        try:
+            with open(path) as state_file:
+                return json.load(state_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def save_state(path, state):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(tmp_path, path)
@@ -0,0 +1,128 @@
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from projects.images import ImageTooLarge, render_derivatives
+from projects.models import ImageJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер очереди изображений: создает JPEG/WebP для сохраненных "
+        "объектов в пуле процессов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Количество процессов для перекодирования",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Сколько заданий забирать из очереди за раз",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Пауза в секундах, если очередь пуста",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=3,
+            help="Число попыток, после которого задание считается упавшим",
+        )
+        parser.add_argument(
+            "--retry-delay",
+            type=float,
+            default=30.0,
+            help=(
+                "Задержка в секундах перед повтором упавшего задания, "
+                "удваивается с каждой попыткой"
+            ),
+        )
+        parser.add_argument(
+            "--lease",
+            type=float,
+            default=settings.IMAGE_JOB_LEASE_SECONDS,
+            help=(
+                "Через сколько секунд задание, взятое в работу, считается "
+                "брошенным и возвращается в очередь. Должно быть больше "
+                "времени обработки одной пачки"
+            ),
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать очередь и завершиться",
+        )
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        lease = timedelta(seconds=options["lease"])
+        self.requeue_expired(lease)
+
+        # Дочерние процессы не работают с БД, соединение им не нужно
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            while True:
+                jobs = ImageJob.claim(options["batch_size"], worker)
+                if not jobs:
+                    if options["once"]:
+                        break
+                    # Пока очередь пуста, подбираем задания упавших воркеров
+                    self.requeue_expired(lease)
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                futures = {
+                    pool.submit(
+                        render_derivatives,
+                        settings.MEDIA_ROOT,
+                        job.source,
+                        settings.IMAGE_VARIANT_WIDTHS,
+                        settings.IMAGE_VARIANT_FORMATS,
+                        settings.IMAGE_MAX_DIMENSION,
+                        settings.IMAGE_MAX_PIXELS,
+                    ): job
+                    for job in jobs
+                }
+                for future in as_completed(futures):
+                    self.finish(futures[future], future, options)
+
+    def requeue_expired(self, lease):
+        # Задания, оставшиеся "в работе" после падения воркера. Задания
+        # других живых воркеров моложе аренды и не возвращаются
+        requeued = ImageJob.requeue_expired(lease)
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь: {requeued}")
+
+    def finish(self, job, future, options):
+        try:
+            result = future.result()
+        except ImageTooLarge as exc:
+            # Повтор не поможет: изображение не пройдет бюджет и в другой раз
+            job.fail(str(exc), max_attempts=0)
+            self.stderr.write(f"{job}: {exc}")
+        except Exception as exc:
+            job.fail(
+                f"{type(exc).__name__}: {exc}",
+                options["max_attempts"],
+                options["retry_delay"],
+            )
+            self.stderr.write(f"{job}: {exc}")
+        else:
+            job.complete(result)
+            self.stdout.write(f"{job}: готово")
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from projects.cache import invalidate_model
+from projects.models import Project, ProjectDetail
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет ProjectDetail.detail_html — detail_text в том виде, в каком "
+        "его отдает API. Нужна для объектов, сохраненных до появления поля"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Сколько объектов обновлять за один запрос",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересчитать HTML у всех объектов, а не только у пустых",
+        )
+
+    def handle(self, *args, **options):
+        queryset = ProjectDetail.objects.exclude(detail_text="")
+        if not options["force"]:
+            queryset = queryset.filter(detail_html="")
+
+        # Страницы по pk: каждая пачка дочитывается до записи, и UPDATE
+        # не идет в таблицу, по которой еще открыт курсор чтения
+        queryset = queryset.order_by("pk")
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)[: options["batch_size"]]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for detail in batch:
+                detail.detail_html = detail.render_detail_html()
+            updated += self.save_batch(batch)
+
+        self.stdout.write(f"Обновлено проектов: {updated}")
+
+    @staticmethod
+    def save_batch(batch):
+        updated = ProjectDetail.objects.bulk_update(batch, ["detail_html"])
+        # bulk_update и update() не вызывают сигналы: time_update входит
+        # в ключи кеша фрагментов, версия модели — в ключи кеша ответов
+        Project.objects.filter(
+            pk__in=[detail.owner_id for detail in batch]
+        ).update(time_update=timezone.now())
+        invalidate_model(Project)
+        return updated
@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from projects.cache import invalidate_model
+from projects.models import Article, Initiative, Project
+
+
+def count_of(model_class, field):
+    """Подзапрос с числом строк ``model_class``, ссылающихся на
+    внешний объект по ``field``."""
+    return Coalesce(
+        Subquery(
+            model_class.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает денормализованные поля: project_id статей и "
+        "счетчики initiatives_count / articles_count — на случай записей "
+        "в обход сигналов (QuerySet.update, bulk_create, правки в SQL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только показать расхождения, ничего не меняя",
+        )
+
+    def handle(self, *args, **options):
+        # Каждый пересчет — один UPDATE с подзапросами. Порядок важен:
+        # счетчики статей проекта считаются по уже исправленному project_id
+        repairs = (
+            (
+                Article,
+                {
+                    "project_id": Subquery(
+                        Initiative.objects.filter(
+                            pk=OuterRef("initiative_id")
+                        ).values("project_id")[:1]
+                    )
+                },
+            ),
+            (
+                Initiative,
+                {"articles_count": count_of(Article, "initiative_id")},
+            ),
+            (
+                Project,
+                {
+                    "initiatives_count": count_of(Initiative, "project_id"),
+                    "articles_count": count_of(Article, "project_id"),
+                },
+            ),
+        )
+
+        with transaction.atomic():
+            for model_class, values in repairs:
+                expected = model_class.objects.annotate(
+                    **{
+                        f"expected_{name}": value
+                        for name, value in values.items()
+                    }
+                )
+                mismatch = Q()
+                for name in values:
+                    mismatch |= ~Q(**{name: F(f"expected_{name}")})
+                broken = expected.filter(mismatch).values("pk")
+                count = broken.count()
+                self.stdout.write(
+                    f"{model_class._meta.verbose_name_plural}: "
+                    f"расхождений {count}"
+                )
+                if count and not options["check"]:
+                    # time_update входит в ключи кеша фрагментов
+                    model_class.objects.filter(pk__in=broken).update(
+                        time_update=timezone.now(), **values
+                    )
+                    invalidate_model(model_class)
@@ -0,0 +1,73 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from projects.cache import bump_model_version
+from projects.signals import CACHED_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную SQLite-базу в реплику (DB_REPLICA_NAME) через "
+        "backup API: для локальной проверки чтения с реплики"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            help="Повторять копирование каждые N секунд (отставание реплики)",
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=1024,
+            help=(
+                "Страниц за шаг копирования: между шагами основная база "
+                "доступна для записи"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        replica = settings.DATABASE_REPLICA
+        if not replica:
+            raise CommandError("Реплика не настроена: задайте DB_REPLICA_NAME")
+        for alias in (DEFAULT_DB_ALIAS, replica):
+            if settings.DATABASES[alias]["ENGINE"] != (
+                "django.db.backends.sqlite3"
+            ):
+                raise CommandError("Копирование поддерживается только SQLite")
+
+        while True:
+            started = time.perf_counter()
+            self.sync(replica, options["pages"])
+            self.stdout.write(
+                f"Реплика обновлена за "
+                f"{(time.perf_counter() - started) * 1000:.0f} мс"
+            )
+            if options["interval"] is None:
+                break
+            time.sleep(options["interval"])
+
+    def sync(self, replica, pages):
+        timeout = settings.SQLITE_PRAGMAS["busy_timeout"] / 1000
+        source = sqlite3.connect(
+            settings.DATABASES[DEFAULT_DB_ALIAS]["NAME"], timeout=timeout
+        )
+        target = sqlite3.connect(
+            settings.DATABASES[replica]["NAME"], timeout=timeout
+        )
+        try:
+            # Снимок согласован: backup видит базу на момент начала шага и
+            # начинает заново, если между шагами в нее писали
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+            source.close()
+
+        # Ответы, закешированные с устаревшей реплики, больше не читаются
+        for model in CACHED_MODELS:
+            bump_model_version(model)
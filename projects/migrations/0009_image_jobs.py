@@ -0,0 +1,80 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('projects', '0008_article_json_blocks_initiative_json_blocks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='derivatives_status',
+            field=models.CharField(choices=[('ready', 'Готово'), ('pending', 'В обработке'), ('failed', 'Ошибка')], default='ready', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='initiative',
+            name='derivatives_status',
+            field=models.CharField(choices=[('ready', 'Готово'), ('pending', 'В обработке'), ('failed', 'Ошибка')], default='ready', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='derivatives_status',
+            field=models.CharField(choices=[('ready', 'Готово'), ('pending', 'В обработке'), ('failed', 'Ошибка')], default='ready', editable=False, max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='image_detail',
+            field=models.ImageField(blank=True, null=True, upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='image_detail',
+            field=models.ImageField(blank=True, null=True, upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='image_detail',
+            field=models.ImageField(blank=True, null=True, upload_to='images'),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('field', models.CharField(max_length=64)),
+                ('source', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Ожидает'), ('running', 'Выполняется'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('time_create', models.DateTimeField(auto_now_add=True)),
+                ('time_update', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Задание обработки изображения',
+                'verbose_name_plural': 'Задания обработки изображений',
+                'ordering': ['id'],
+            },
+        ),
+    ]
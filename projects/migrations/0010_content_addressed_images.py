@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:09
+
+import projects.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0009_image_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=projects.storage.ContentAddressedStorage(), upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='image_detail',
+            field=models.ImageField(blank=True, null=True, storage=projects.storage.ContentAddressedStorage(), upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=projects.storage.ContentAddressedStorage(), upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='image_detail',
+            field=models.ImageField(blank=True, null=True, storage=projects.storage.ContentAddressedStorage(), upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=projects.storage.ContentAddressedStorage(), upload_to='images'),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='image_detail',
+            field=models.ImageField(blank=True, null=True, storage=projects.storage.ContentAddressedStorage(), upload_to='images'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0010_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='srcset',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='initiative',
+            name='srcset',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='srcset',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original', models.CharField(db_index=True, max_length=255)),
+                ('format', models.CharField(max_length=16)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=255)),
+            ],
+            options={
+                'verbose_name': 'Вариант изображения',
+                'verbose_name_plural': 'Варианты изображений',
+                'constraints': [models.UniqueConstraint(fields=('original', 'format', 'width'), name='unique_image_derivative')],
+            },
+        ),
+    ]
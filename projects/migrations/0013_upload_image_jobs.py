@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('projects', '0012_image_meta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagejob',
+            name='content_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype'),
+        ),
+        migrations.AlterField(
+            model_name='imagejob',
+            name='field',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='imagejob',
+            name='object_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
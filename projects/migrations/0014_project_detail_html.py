@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0013_upload_image_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='detail_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0014_project_detail_html'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='is_published',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='time_create',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='article',
+            name='time_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='is_published',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='time_create',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='time_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='is_published',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='time_create',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='time_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0015_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='article',
+            name='is_published',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='initiative',
+            name='is_published',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='is_published',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['time_create', 'id'], name='art_pub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['initiative_id', 'time_create', 'id'], name='art_initiative_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['cat_id', 'time_create', 'id'], name='art_cat_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='initiative',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['time_create', 'id'], name='init_pub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='initiative',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['project_id', 'time_create', 'id'], name='init_project_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['time_create', 'id'], name='proj_pub_created_idx'),
+        ),
+    ]
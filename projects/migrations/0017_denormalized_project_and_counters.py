@@ -0,0 +1,76 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_denormalized_fields(apps, schema_editor):
+    Project = apps.get_model('projects', 'Project')
+    Initiative = apps.get_model('projects', 'Initiative')
+    Article = apps.get_model('projects', 'Article')
+
+    Article.objects.update(
+        project_id=Subquery(
+            Initiative.objects.filter(pk=OuterRef('initiative_id')).values('project_id')[:1]
+        )
+    )
+
+    def count(model, field):
+        return Coalesce(
+            Subquery(
+                model.objects.filter(**{field: OuterRef('pk')})
+                .order_by()
+                .values(field)
+                .annotate(count=Count('pk'))
+                .values('count')
+            ),
+            0,
+        )
+
+    Initiative.objects.update(articles_count=count(Article, 'initiative_id'))
+    Project.objects.update(
+        initiatives_count=count(Initiative, 'project_id'),
+        articles_count=count(Article, 'project_id'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0016_list_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='project_id',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='projects.project'),
+        ),
+        migrations.AddField(
+            model_name='initiative',
+            name='articles_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='articles_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='initiatives_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_denormalized_fields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='article',
+            name='project_id',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='projects.project'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['project_id', 'time_create', 'id'], name='art_project_pub_idx'),
+        ),
+    ]
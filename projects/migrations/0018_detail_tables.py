@@ -0,0 +1,122 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:44
+
+import django.db.models.deletion
+import projects.models
+import tinymce.models
+from django.db import migrations, models
+
+# Модель-владелец -> (модель деталей, переносимые колонки)
+DETAIL_TABLES = {
+    'project': ('projectdetail', ['detail_text', 'detail_html', 'json_blocks']),
+    'initiative': ('initiativedetail', ['detail_text', 'json_blocks']),
+    'article': ('articledetail', ['detail_text', 'json_blocks']),
+}
+
+
+def tables(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for owner_name, (detail_name, columns) in DETAIL_TABLES.items():
+        owner = apps.get_model('projects', owner_name)._meta.db_table
+        detail = apps.get_model('projects', detail_name)._meta.db_table
+        yield quote(owner), quote(detail), [quote(column) for column in columns]
+
+
+def copy_to_detail_tables(apps, schema_editor):
+    # Один INSERT ... SELECT на таблицу, без загрузки строк в Python
+    quote = schema_editor.quote_name
+    for owner, detail, columns in tables(apps, schema_editor):
+        schema_editor.execute(
+            f'INSERT INTO {detail} ({quote("owner_id")}, {", ".join(columns)}) '
+            f'SELECT {quote("id")}, {", ".join(columns)} FROM {owner}'
+        )
+
+
+def copy_from_detail_tables(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for owner, detail, columns in tables(apps, schema_editor):
+        # У объектов без строки деталей остается значение по умолчанию
+        assignments = ', '.join(
+            f'{column} = COALESCE((SELECT {column} FROM {detail} '
+            f'WHERE {detail}.{quote("owner_id")} = {owner}.{quote("id")}), {column})'
+            for column in columns
+        )
+        schema_editor.execute(f'UPDATE {owner} SET {assignments}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0017_denormalized_project_and_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleDetail',
+            fields=[
+                ('detail_text', tinymce.models.HTMLField(blank=True)),
+                ('json_blocks', models.JSONField(blank=True, null=True)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='detail', serialize=False, to='projects.article')),
+            ],
+            options={
+                'verbose_name': 'Детали статьи',
+                'verbose_name_plural': 'Детали статей',
+            },
+            bases=(projects.models.ChangeTrackingMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='InitiativeDetail',
+            fields=[
+                ('detail_text', tinymce.models.HTMLField(blank=True)),
+                ('json_blocks', models.JSONField(blank=True, null=True)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='detail', serialize=False, to='projects.initiative')),
+            ],
+            options={
+                'verbose_name': 'Детали инициативы',
+                'verbose_name_plural': 'Детали инициатив',
+            },
+            bases=(projects.models.ChangeTrackingMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='ProjectDetail',
+            fields=[
+                ('detail_text', tinymce.models.HTMLField(blank=True)),
+                ('json_blocks', models.JSONField(blank=True, null=True)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='detail', serialize=False, to='projects.project')),
+                ('detail_html', models.TextField(blank=True, editable=False)),
+            ],
+            options={
+                'verbose_name': 'Детали проекта',
+                'verbose_name_plural': 'Детали проектов',
+            },
+            bases=(projects.models.HTMLTableWrapperMixin, projects.models.ChangeTrackingMixin, models.Model),
+        ),
+        migrations.RunPython(copy_to_detail_tables, copy_from_detail_tables),
+        migrations.RemoveField(
+            model_name='article',
+            name='detail_text',
+        ),
+        migrations.RemoveField(
+            model_name='article',
+            name='json_blocks',
+        ),
+        migrations.RemoveField(
+            model_name='initiative',
+            name='detail_text',
+        ),
+        migrations.RemoveField(
+            model_name='initiative',
+            name='json_blocks',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='detail_html',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='detail_text',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='json_blocks',
+        ),
+    ]
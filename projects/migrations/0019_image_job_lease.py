@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 07:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0018_detail_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='available_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='imagejob',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagejob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=128),
+        ),
+    ]
@@ -1,158 +1,605 @@
-import os
-from urllib.parse import urlparse
+import hashlib
+import json
+from datetime import timedelta
 
-from bs4 import BeautifulSoup
 from django.contrib.auth.models import User
-from django.db import models
-from PIL import Image as PilImage
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
 from tinymce.models import HTMLField
 
 from djangoNp import settings
 
+from .cache import invalidate_model
+from .html_rewriter import AbsoluteImageSrc, HTMLRewriter, WrapTables
+from .images import IMAGES_DIR, srcset_manifest
+from .storage import image_storage
+
+
+class DerivativesStatus(models.TextChoices):
+    READY = "ready", "Готово"
+    PENDING = "pending", "В обработке"
+    FAILED = "failed", "Ошибка"
+
+
+class ImageJob(models.Model):
+    """Задание очереди на генерацию производных изображений (JPEG/WebP).
+
+    Задания создаются в той же транзакции, что и сохранение объекта,
+    и выполняются командой ``manage.py process_image_jobs`` после коммита.
+    Успешно выполненные задания удаляются.
+
+    Воркер берет задание в аренду (``claimed_at``, ``worker``): задание,
+    аренда которого истекла, считается брошенным упавшим воркером
+    и возвращается в очередь. Упавшие попытки повторяются с
+    экспоненциальной задержкой (``available_at``).
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Ожидает"
+        RUNNING = "running", "Выполняется"
+        FAILED = "failed", "Ошибка"
+
+    # Для загрузок из редактора объекта нет: создаются только варианты
+    content_type = models.ForeignKey(
+        ContentType, on_delete=models.CASCADE, null=True, blank=True
+    )
+    object_id = models.PositiveBigIntegerField(null=True, blank=True)
+    field = models.CharField(max_length=64, blank=True)
+    source = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+        db_index=True,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Раньше этого момента задание не берется (задержка перед повтором)
+    available_at = models.DateTimeField(default=timezone.now)
+    # Кто и когда взял задание в работу
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=128, blank=True)
+    time_create = models.DateTimeField(auto_now_add=True)
+    time_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Задание обработки изображения"
+        verbose_name_plural = "Задания обработки изображений"
+        ordering = ["id"]
+
+    def __str__(self):
+        if self.content_type_id is None:
+            return self.source
+        return f"{self.content_type.model}#{self.object_id}.{self.field}"
+
+    @classmethod
+    def enqueue(cls, instance, fields):
+        """Ставит в очередь обработку указанных полей объекта."""
+        if not fields:
+            return
+
+        content_type = ContentType.objects.get_for_model(instance)
+        # Новое задание заменяет ещё не взятые и упавшие задания по полю
+        cls.objects.filter(
+            content_type=content_type,
+            object_id=instance.pk,
+            field__in=fields,
+            status__in=[cls.Status.PENDING, cls.Status.FAILED],
+        ).delete()
+        cls.objects.bulk_create(
+            cls(
+                content_type=content_type,
+                object_id=instance.pk,
+                field=field,
+                source=getattr(instance, field).name,
+            )
+            for field in fields
+        )
+
+    @classmethod
+    def enqueue_upload(cls, name):
+        """Ставит в очередь создание вариантов для файла без объекта."""
+        cls.objects.create(source=name)
+
+    @classmethod
+    def claim(cls, limit, worker=""):
+        """Забирает до ``limit`` ожидающих заданий в работу воркером
+        ``worker``."""
+        now = timezone.now()
+        ids = cls.objects.filter(
+            status=cls.Status.PENDING, available_at__lte=now
+        ).values_list("id", flat=True)[:limit]
+        claimed = [
+            job_id
+            for job_id in ids
+            # Обновляем по одному, чтобы два воркера не взяли одно задание
+            if cls.objects.filter(id=job_id, status=cls.Status.PENDING).update(
+                status=cls.Status.RUNNING,
+                attempts=models.F("attempts") + 1,
+                claimed_at=now,
+                worker=worker,
+                time_update=now,
+            )
+        ]
+        return list(
+            cls.objects.filter(id__in=claimed).select_related("content_type")
+        )
+
+    @classmethod
+    def requeue_expired(cls, lease):
+        """Возвращает в очередь задания, аренда которых старше ``lease``
+        (timedelta): их воркер упал или был остановлен. Задания живых
+        воркеров не трогает."""
+        return (
+            cls.objects.filter(status=cls.Status.RUNNING)
+            .filter(
+                models.Q(claimed_at__lt=timezone.now() - lease)
+                | models.Q(claimed_at__isnull=True)
+            )
+            .update(
+                status=cls.Status.PENDING,
+                claimed_at=None,
+                worker="",
+                time_update=timezone.now(),
+            )
+        )
+
+    def complete(self, result):
+        """Записывает готовые производные в объект и удаляет задание."""
+        with transaction.atomic():
+            ImageDerivative.objects.bulk_create(
+                (
+                    ImageDerivative(original=result["jpeg"], **variant)
+                    for variant in result["variants"]
+                ),
+                ignore_conflicts=True,
+            )
+            if self.content_type_id is None:
+                self.delete()
+                return
+
+            model_class = self.content_type.model_class()
+
+            # Если поле успели изменить, результат уже неактуален:
+            # для нового файла в очереди есть своё задание
+            owner = model_class.objects.filter(
+                pk=self.object_id, **{self.field: self.source}
+            )
+            current = owner.values("srcset", "image_meta").first()
+            if current is not None:
+                current["srcset"][self.field] = srcset_manifest(result)
+                current["image_meta"][self.field] = result["meta"]
+                owner.update(
+                    **current,
+                    **{
+                        self.field: result["jpeg"],
+                        f"{self.field}_webp": result["webp"],
+                        "time_update": timezone.now(),
+                    },
+                )
+            self.delete()
+            self.update_owner_status()
+
+    def fail(self, error, max_attempts, retry_delay=0):
+        """Возвращает задание в очередь или помечает его упавшим.
+
+        Повтор откладывается на ``retry_delay`` секунд, удваиваясь
+        с каждой попыткой.
+        """
+        self.error = error
+        self.claimed_at = None
+        self.worker = ""
+        if self.attempts < max_attempts:
+            self.status = self.Status.PENDING
+            self.available_at = timezone.now() + timedelta(
+                seconds=retry_delay * 2 ** max(self.attempts - 1, 0)
+            )
+        else:
+            self.status = self.Status.FAILED
+        with transaction.atomic():
+            self.save(
+                update_fields=[
+                    "status",
+                    "error",
+                    "available_at",
+                    "claimed_at",
+                    "worker",
+                    "time_update",
+                ]
+            )
+            if self.content_type_id is not None:
+                self.update_owner_status()
+
+    def update_owner_status(self):
+        jobs = ImageJob.objects.filter(
+            content_type=self.content_type, object_id=self.object_id
+        )
+        if jobs.filter(status=self.Status.FAILED).exists():
+            status = DerivativesStatus.FAILED
+        elif jobs.exists():
+            status = DerivativesStatus.PENDING
+        else:
+            status = DerivativesStatus.READY
+
+        model_class = self.content_type.model_class()
+        # time_update тоже меняется: по нему строятся ETag и ключи
+        # кеша фрагментов, а derivatives_status виден в API
+        model_class.objects.filter(pk=self.object_id).exclude(
+            derivatives_status=status
+        ).update(derivatives_status=status, time_update=timezone.now())
+        # update() не вызывает сигналы: сбрасываем кеш ответов сами
+        invalidate_model(model_class)
+
+
+class ImageDerivative(models.Model):
+    """Уменьшенная копия изображения заданной ширины и формата.
+
+    Варианты привязаны к имени оптимизированного файла, а не к объекту:
+    одинаковые изображения разных объектов используют общие варианты.
+    """
+
+    original = models.CharField(max_length=255, db_index=True)
+    format = models.CharField(max_length=16)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+
+    class Meta:
+        verbose_name = "Вариант изображения"
+        verbose_name_plural = "Варианты изображений"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["original", "format", "width"],
+                name="unique_image_derivative",
+            )
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class ChangeTrackingMixin:
+    """Запоминает состояние полей ``tracked_fields`` при загрузке из БД.
+
+    Позволяет в ``save()`` пропускать дорогую обработку (PIL, разбор HTML)
+    для полей, которые не менялись. Миксин должен стоять в списке
+    базовых классов перед ``models.Model``.
+    """
+
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.reset_tracking()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using, fields, **kwargs)
+        # Перечитанные поля снова совпадают с БД. Сюда же приходит
+        # догрузка отложенного поля при первом обращении к нему
+        refreshed = None if fields is None else set(fields)
+        loaded_state = getattr(self, "_loaded_state", {})
+        deferred = self.get_deferred_fields()
+        for field in self.tracked_fields:
+            if field in deferred:
+                continue
+            if (
+                refreshed is None
+                or field in refreshed
+                # tracked_fields могут быть attname: project_id_id
+                or field.removesuffix("_id") in refreshed
+            ):
+                loaded_state[field] = self._tracked_value(field)
+        self._loaded_state = loaded_state
+
+    def _tracked_value(self, field):
+        value = getattr(self, field)
+        if isinstance(value, FieldFile):
+            return value.name or ""
+        if isinstance(value, (dict, list)):
+            # JSON меняют на месте: сравниваем сериализованный вид
+            value = json.dumps(value, sort_keys=True, default=str)
+        if isinstance(value, str):
+            # Для HTML храним дайджест, а не копию всего текста
+            return hashlib.blake2b(value.encode(), digest_size=16).digest()
+        return value
+
+    def reset_tracking(self):
+        deferred = self.get_deferred_fields()
+        self._loaded_state = {
+            field: self._tracked_value(field)
+            for field in self.tracked_fields
+            if field not in deferred
+        }
+
+    def loaded_value(self, field):
+        """Значение поля на момент загрузки из БД (None для новых)."""
+        return getattr(self, "_loaded_state", {}).get(field)
+
+    def has_changed(self, field):
+        loaded_state = getattr(self, "_loaded_state", None)
+        if self._state.adding or loaded_state is None:
+            return True
+
+        if field not in loaded_state:
+            # Отложенное поле, к которому не обращались, не менялось
+            return field not in self.get_deferred_fields()
+
+        value = getattr(self, field)
+        if isinstance(value, FieldFile) and not value._committed:
+            # Новый загруженный файл, даже если имя совпало со старым
+            return True
+
+        return self._tracked_value(field) != loaded_state[field]
+
+
+class DenormalizedFieldsMixin:
+    """Не записывает ``denormalized_fields`` обычным ``save()``
+    существующего объекта.
+
+    Эти поля поддерживаются ``UPDATE ... F()`` в ``projects.signals``
+    (счетчики) или копируются из родителя (``Article.project_id``):
+    в загруженном раньше объекте они могли устареть и затерли бы значения
+    в БД. Поля, которые ``save()`` модели пересчитал сам, он передает
+    в ``written_fields``.
+    """
+
+    denormalized_fields = ()
+
+    def save(self, *args, written_fields=(), **kwargs):
+        if (
+            self.denormalized_fields
+            and not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            skipped = set(self.denormalized_fields) - set(written_fields)
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in skipped
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
+class HTMLTableWrapperMixin:
+    def wrap_tables_in_html(self, html_content):
+        return HTMLRewriter([WrapTables()]).rewrite(html_content)
+
+
+def detail_property(name):
+    """Поле из таблицы деталей, доступное как атрибут владельца."""
+
+    def getter(self):
+        return getattr(self.get_detail(), name)
+
+    def setter(self, value):
+        setattr(self.get_detail(), name, value)
 
-def is_absolute_url(url):
-    parsed_url = urlparse(url)
-    return bool(parsed_url.scheme) and bool(parsed_url.netloc)
+    return property(getter, setter)
+
+
+class DetailOwnerMixin:
+    """Тяжелые поля объекта (``detail_text``, ``json_blocks``) хранятся в
+    отдельной таблице один-к-одному (``<Модель>Detail``, связь
+    ``detail``), чтобы списки и выборки без них не читали мегабайты
+    HTML и JSON вместе с короткими колонками.
+
+    Поля доступны как атрибуты владельца: строка деталей читается при
+    первом обращении (API подгружает ее через ``select_related("detail")``
+    только для детальных ответов) и сохраняется в ``save()`` владельца,
+    если ее загружали и меняли.
+    """
+
+    detail_text = detail_property("detail_text")
+    json_blocks = detail_property("json_blocks")
+
+    @property
+    def loaded_detail(self):
+        """Строка деталей, если она уже загружена или создана, иначе
+        None."""
+        related = type(self).detail.related
+        if related.is_cached(self):
+            return related.get_cached_value(self)
+        return None
+
+    def get_detail(self):
+        detail = self.loaded_detail
+        if detail is None:
+            try:
+                detail = self.detail
+            except ObjectDoesNotExist:
+                # Новый объект или объект, у которого деталей еще нет
+                detail = type(self).detail.related.related_model(owner=self)
+        return detail
+
+    def save_detail(self):
+        detail = self.loaded_detail
+        if detail is not None and any(
+            detail.has_changed(field) for field in detail.tracked_fields
+        ):
+            detail.save()
 
 
 class ImageOptimizationMixin:
     def optimize_image(self, *args, **kwargs):
+        """Определяет поля, изображения которых нужно обработать в фоне.
+
+        Сами производные создаются воркером после коммита, а до тех пор
+        API продолжает отдавать прежние ``*_webp``.
+        """
         # Получаем список полей с изображениями (по умолчанию это 'image')
         image_fields = getattr(self, "image_fields", ["image"])
+        queued_fields = []
 
         for field in image_fields:
+            if not self.has_changed(field):
+                # Изображение не менялось, производные остаются прежними
+                continue
+
             image = getattr(self, field, None)
             if image:
-                # Оптимизация и создание WebP для каждого изображения
-                self.compress_image(field)
-                self.create_webp_image(field)
+                queued_fields.append(field)
             else:
                 # Если изображения нет, очищаем соответствующее поле _webp
                 setattr(self, f"{field}_webp", None)
+                self.srcset.pop(field, None)
+                self.image_meta.pop(field, None)
 
-    def compress_image(self, field):
-        # Получаем изображение для текущего поля
-        image = getattr(self, field)
-        image_name = os.path.basename(image.path)
-        image_path = os.path.join("media/images/", image_name)
-
-        # Создаем директорию, если она не существует
-        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-
-        # Открываем изображение с помощью PIL и конвертируем в RGB, если нужно
-        pil_image = PilImage.open(image)
-        if pil_image.mode == "RGBA":
-            pil_image = pil_image.convert("RGB")
-
-        # Сохраняем изображение в JPEG формате с оптимизацией
-        pil_image.save(image_path, format="JPEG", quality=80, optimize=True)
-
-        # Обновляем путь в поле изображения
-        setattr(self, field, image_path.replace("media/", ""))
-
-    def create_webp_image(self, field):
-        # Формируем путь для изображения в формате WebP
-        image = getattr(self, field)
-        image_name = os.path.basename(image.path)
-        webp_image_name = os.path.splitext(image_name)[0] + ".webp"
-        webp_image_path = os.path.join("media/images/", webp_image_name)
-        original_image_path = os.path.join("media/images/", image_name)
+        if queued_fields:
+            self.derivatives_status = DerivativesStatus.PENDING
 
-        # Создаем директорию, если она не существует
-        os.makedirs(os.path.dirname(webp_image_path), exist_ok=True)
+        return queued_fields
 
-        # Открываем изображение для конвертации в WebP
-        pil_image = PilImage.open(original_image_path)
+    def enqueue_image_jobs(self, fields):
+        ImageJob.enqueue(self, fields)
 
-        # Сохраняем изображение в WebP формате
-        pil_image.save(webp_image_path, format="webp", quality=80)
 
-        # Обновляем путь к WebP изображению
-        setattr(self, f"{field}_webp", webp_image_path.replace("media/", ""))
-
-
-class Project(models.Model, ImageOptimizationMixin):
+class Project(
+    DetailOwnerMixin,
+    ChangeTrackingMixin,
+    DenormalizedFieldsMixin,
+    models.Model,
+    ImageOptimizationMixin,
+):
     title = models.CharField(max_length=255)
     content = models.TextField(blank=True)
-    detail_text = HTMLField(blank=True)
-    time_create = models.DateTimeField(auto_now_add=True)
-    time_update = models.DateTimeField(auto_now=True)
+    time_create = models.DateTimeField(auto_now_add=True, db_index=True)
+    time_update = models.DateTimeField(auto_now=True, db_index=True)
     is_published = models.BooleanField(default=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    image = models.ImageField(blank=True, null=True)
+    # Денормализованные счетчики, обновляются в projects.signals
+    initiatives_count = models.PositiveIntegerField(default=0, editable=False)
+    articles_count = models.PositiveIntegerField(default=0, editable=False)
+    image = models.ImageField(
+        blank=True, null=True, upload_to=IMAGES_DIR, storage=image_storage
+    )
     image_webp = models.ImageField(blank=True, null=True)
-    image_detail = models.ImageField(blank=True, null=True)
+    image_detail = models.ImageField(
+        blank=True, null=True, upload_to=IMAGES_DIR, storage=image_storage
+    )
     image_detail_webp = models.ImageField(blank=True, null=True)
-    json_blocks = models.JSONField(blank=True, null=True)
+    derivatives_status = models.CharField(
+        max_length=16,
+        choices=DerivativesStatus.choices,
+        default=DerivativesStatus.READY,
+        editable=False,
+    )
+    # Манифест вариантов по ширинам: {поле: {формат: [[ширина, имя], ...]}}
+    srcset = models.JSONField(default=dict, blank=True, editable=False)
+    # Размеры, цвет и LQIP-заглушка: {поле: {width, height, color, lqip}}
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
 
     # Указываем поля с изображениями, которые нужно обрабатывать
     image_fields = ["image", "image_detail"]
+    tracked_fields = ("image", "image_detail")
+    denormalized_fields = ("initiatives_count", "articles_count")
+    # detail_text в том виде, в каком его отдает API (см. ProjectDetail)
+    detail_html = detail_property("detail_html")
 
     class Meta:
         verbose_name = "Проект"
         verbose_name_plural = "Проекты"
+        # Списки API: filter(is_published=True).order_by("time_create", "id").
+        # Индексы частичные: Django пишет условие как WHERE "is_published",
+        # и с таким условием SQLite не использует is_published как столбец
+        # составного индекса, а частичный индекс с тем же условием — да
+        indexes = [
+            models.Index(
+                fields=["time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="proj_pub_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
         # оптимизация изображения, метод из ImageOptimizationMixin
-        self.optimize_image(*args, **kwargs)
-
-        # Заменяем относительные URL на абсолютные перед сохранением
-        if self.detail_text:
-            self.detail_text = self.convert_relative_to_absolute(
-                self.detail_text
-            )
-
-        super().save(*args, **kwargs)
-
-    def convert_relative_to_absolute(self, html_content):
-        # Базовый URL для формирования абсолютных ссылок
-        base_url = f"{settings.SITE_URL}"
-
-        # Используем BeautifulSoup для разбора HTML содержимого
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        # Обновляем атрибуты src и data-mce-src
-        for img in soup.find_all("img"):
-            if img.has_attr("src") and not is_absolute_url(img["src"]):
-                relative_src = img["src"]
-
-                img["src"] = f"{base_url}/{relative_src.lstrip('../')}"
-
-        # Возвращаем обновленное содержимое
-        return str(soup)
-
-
-class Initiative(models.Model, ImageOptimizationMixin):
+        queued_fields = self.optimize_image(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.save_detail()
+            self.enqueue_image_jobs(queued_fields)
+        self.reset_tracking()
+
+
+class Initiative(
+    DetailOwnerMixin,
+    ChangeTrackingMixin,
+    DenormalizedFieldsMixin,
+    models.Model,
+    ImageOptimizationMixin,
+):
     title = models.CharField(max_length=255)
     content = models.TextField(blank=True)
-    detail_text = HTMLField(blank=True)
-    time_create = models.DateTimeField(auto_now_add=True)
-    time_update = models.DateTimeField(auto_now=True)
+    time_create = models.DateTimeField(auto_now_add=True, db_index=True)
+    time_update = models.DateTimeField(auto_now=True, db_index=True)
     is_published = models.BooleanField(default=True)
     project_id = models.ForeignKey(Project, on_delete=models.CASCADE)
-    image = models.ImageField(blank=True, null=True)
+    # Денормализованный счетчик, обновляется в projects.signals
+    articles_count = models.PositiveIntegerField(default=0, editable=False)
+    image = models.ImageField(
+        blank=True, null=True, upload_to=IMAGES_DIR, storage=image_storage
+    )
     image_webp = models.ImageField(blank=True, null=True)
-    image_detail = models.ImageField(blank=True, null=True)
+    image_detail = models.ImageField(
+        blank=True, null=True, upload_to=IMAGES_DIR, storage=image_storage
+    )
     image_detail_webp = models.ImageField(blank=True, null=True)
-    json_blocks = models.JSONField(blank=True, null=True)
+    derivatives_status = models.CharField(
+        max_length=16,
+        choices=DerivativesStatus.choices,
+        default=DerivativesStatus.READY,
+        editable=False,
+    )
+    # Манифест вариантов по ширинам: {поле: {формат: [[ширина, имя], ...]}}
+    srcset = models.JSONField(default=dict, blank=True, editable=False)
+    # Размеры, цвет и LQIP-заглушка: {поле: {width, height, color, lqip}}
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
 
     # Указываем поля с изображениями, которые нужно обрабатывать
     image_fields = ["image", "image_detail"]
+    # project_id_id — чтобы при переносе обновить и прежний проект
+    tracked_fields = ("image", "image_detail", "project_id_id")
+    denormalized_fields = ("articles_count",)
 
     class Meta:
         verbose_name = "Инициатива"
         verbose_name_plural = "Инициатива"
+        indexes = [
+            models.Index(
+                fields=["time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="init_pub_created_idx",
+            ),
+            # ?project_id= в списке инициатив
+            models.Index(
+                fields=["project_id", "time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="init_project_pub_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
         # оптимизация изображения, метод из ImageOptimizationMixin
-        self.optimize_image(*args, **kwargs)
-        super().save(*args, **kwargs)
+        queued_fields = self.optimize_image(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.save_detail()
+            self.enqueue_image_jobs(queued_fields)
+        self.reset_tracking()
 
 
 class ArticleCategory(models.Model):
@@ -166,32 +613,181 @@ class ArticleCategory(models.Model):
         return self.title
 
 
-class Article(models.Model, ImageOptimizationMixin):
+class Article(
+    DetailOwnerMixin,
+    ChangeTrackingMixin,
+    DenormalizedFieldsMixin,
+    models.Model,
+    ImageOptimizationMixin,
+):
     title = models.CharField(max_length=255)
     content = models.TextField(blank=True)
-    detail_text = HTMLField(blank=True)
-    time_create = models.DateTimeField(auto_now_add=True)
-    time_update = models.DateTimeField(auto_now=True)
+    time_create = models.DateTimeField(auto_now_add=True, db_index=True)
+    time_update = models.DateTimeField(auto_now=True, db_index=True)
     is_published = models.BooleanField(default=True)
     initiative_id = models.ForeignKey(Initiative, on_delete=models.CASCADE)
+    # Проект инициативы, скопированный в статью: фильтр по проекту
+    # и project_id в API обходятся без JOIN. Заполняется в save(), при
+    # переносе инициативы обновляется в projects.signals
+    project_id = models.ForeignKey(
+        Project, on_delete=models.CASCADE, editable=False
+    )
     cat_id = models.ForeignKey(ArticleCategory, on_delete=models.CASCADE)
-    image = models.ImageField(blank=True, null=True)
+    image = models.ImageField(
+        blank=True, null=True, upload_to=IMAGES_DIR, storage=image_storage
+    )
     image_webp = models.ImageField(blank=True, null=True)
-    image_detail = models.ImageField(blank=True, null=True)
+    image_detail = models.ImageField(
+        blank=True, null=True, upload_to=IMAGES_DIR, storage=image_storage
+    )
     image_detail_webp = models.ImageField(blank=True, null=True)
-    json_blocks = models.JSONField(blank=True, null=True)
+    derivatives_status = models.CharField(
+        max_length=16,
+        choices=DerivativesStatus.choices,
+        default=DerivativesStatus.READY,
+        editable=False,
+    )
+    # Манифест вариантов по ширинам: {поле: {формат: [[ширина, имя], ...]}}
+    srcset = models.JSONField(default=dict, blank=True, editable=False)
+    # Размеры, цвет и LQIP-заглушка: {поле: {width, height, color, lqip}}
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
 
     # Указываем поля с изображениями, которые нужно обрабатывать
     image_fields = ["image", "image_detail"]
+    tracked_fields = (
+        "image",
+        "image_detail",
+        "initiative_id_id",
+        "project_id_id",
+    )
+    # Записывается, только когда save() пересчитал его при смене
+    # инициативы: у статьи, загруженной до переноса инициативы, он устарел
+    denormalized_fields = ("project_id_id",)
 
     def save(self, *args, **kwargs):
         # оптимизация изображения, метод из ImageOptimizationMixin
-        self.optimize_image(*args, **kwargs)
-        super().save(*args, **kwargs)
+        queued_fields = self.optimize_image(*args, **kwargs)
+        with transaction.atomic():
+            written_fields = ()
+            if self.has_changed("initiative_id_id") or not self.project_id_id:
+                self.project_id_id = (
+                    Initiative.objects.filter(pk=self.initiative_id_id)
+                    .values_list("project_id", flat=True)
+                    .get()
+                )
+                written_fields = ("project_id_id",)
+            super().save(*args, written_fields=written_fields, **kwargs)
+            self.save_detail()
+            self.enqueue_image_jobs(queued_fields)
+        self.reset_tracking()
 
     class Meta:
         verbose_name = "Статья"
         verbose_name_plural = "Статья"
+        indexes = [
+            models.Index(
+                fields=["time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="art_pub_created_idx",
+            ),
+            # ?initiative_id=, ?project_id= и ?cat_id= в списке статей
+            models.Index(
+                fields=["project_id", "time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="art_project_pub_idx",
+            ),
+            models.Index(
+                fields=["initiative_id", "time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="art_initiative_pub_idx",
+            ),
+            models.Index(
+                fields=["cat_id", "time_create", "id"],
+                condition=models.Q(is_published=True),
+                name="art_cat_pub_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class DetailBase(ChangeTrackingMixin, models.Model):
+    """Поля, которые нужны только детальному ответу (см.
+    ``DetailOwnerMixin``)."""
+
+    detail_text = HTMLField(blank=True)
+    json_blocks = models.JSONField(blank=True, null=True)
+
+    tracked_fields = ("detail_text", "json_blocks")
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.reset_tracking()
+
+
+class ProjectDetail(HTMLTableWrapperMixin, DetailBase):
+    owner = models.OneToOneField(
+        Project,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="detail",
+    )
+    # detail_text в том виде, в каком его отдает API (см. render_detail_html)
+    detail_html = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        verbose_name = "Детали проекта"
+        verbose_name_plural = "Детали проектов"
+
+    def save(self, *args, **kwargs):
+        # Заменяем относительные URL на абсолютные перед сохранением
+        if self.detail_text and self.has_changed("detail_text"):
+            self.detail_text = self.convert_relative_to_absolute(
+                self.detail_text
+            )
+
+        # Готовим HTML для API, чтобы чтение не разбирало его заново
+        if self.has_changed("detail_text") or (
+            self.detail_text and not self.detail_html
+        ):
+            self.detail_html = self.render_detail_html()
+
+        super().save(*args, **kwargs)
+
+    def render_detail_html(self):
+        return self.wrap_tables_in_html(self.detail_text)
+
+    def convert_relative_to_absolute(self, html_content):
+        # Базовый URL для формирования абсолютных ссылок
+        base_url = f"{settings.SITE_URL}"
+        return HTMLRewriter([AbsoluteImageSrc(base_url)]).rewrite(html_content)
+
+
+class InitiativeDetail(DetailBase):
+    owner = models.OneToOneField(
+        Initiative,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="detail",
+    )
+
+    class Meta:
+        verbose_name = "Детали инициативы"
+        verbose_name_plural = "Детали инициатив"
+
+
+class ArticleDetail(DetailBase):
+    owner = models.OneToOneField(
+        Article,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="detail",
+    )
+
+    class Meta:
+        verbose_name = "Детали статьи"
+        verbose_name_plural = "Детали статей"
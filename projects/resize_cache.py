@@ -0,0 +1,131 @@
+import hashlib
+import os
+
+from django.core.files import locks
+
+
+class ResizeCache:
+    """Дисковый кеш изображений, отрендеренных по запросу.
+
+    Вытеснение — LRU по mtime: при каждом попадании время файла
+    обновляется, а при превышении ``max_bytes`` удаляются самые давно
+    использованные файлы. Одновременные запросы одного и того же варианта
+    ждут на файловой блокировке, и рендер выполняется один раз даже
+    между разными процессами gunicorn.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Сколько записано этим процессом с последнего вытеснения
+        self._written = 0
+
+    def path_for(self, key, extension):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(
+            self.directory, digest[:2], f"{digest}.{extension}"
+        )
+
+    def _open_hit(self, path):
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        # Отмечаем использование для LRU
+        os.utime(path)
+        return file
+
+    def open_or_render(self, key, extension, render):
+        """Открывает закешированный файл, при промахе создает его.
+
+        ``render(path)`` вызывается под блокировкой и должен записать
+        файл по переданному пути.
+        """
+        path = self.path_for(key, extension)
+        file = self._open_hit(path)
+        if file is not None:
+            return file
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock(path) as lock_file:
+            try:
+                # Пока мы ждали блокировку, файл мог отрендерить сосед
+                file = self._open_hit(path)
+                if file is None:
+                    render(path)
+                    self._written += os.path.getsize(path)
+                    file = open(path, "rb")
+            finally:
+                locks.unlock(lock_file)
+
+        # Обходим каталог не на каждый промах, а после записи
+        # заметной доли бюджета
+        if self._written > self.max_bytes // 10:
+            self.evict()
+        return file
+
+    def _lock(self, path):
+        """Открывает и блокирует файл блокировки варианта.
+
+        ``evict()`` удаляет только свободные блокировки, но между
+        открытием и блокировкой файл могли удалить: тогда блокировка
+        ничего не защищает и берется заново на файле, который лежит
+        на диске.
+        """
+        lock_path = f"{path}.lock"
+        while True:
+            lock_file = open(lock_path, "ab")
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                current = os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+            locks.unlock(lock_file)
+            lock_file.close()
+
+    def _remove_lock(self, path):
+        """Удаляет файл блокировки, если его никто не держит."""
+        try:
+            fd = os.open(f"{path}.lock", os.O_WRONLY)
+        except FileNotFoundError:
+            return
+        try:
+            if locks.lock(fd, locks.LOCK_EX | locks.LOCK_NB):
+                try:
+                    os.remove(f"{path}.lock")
+                finally:
+                    locks.unlock(fd)
+        finally:
+            os.close(fd)
+
+    def evict(self):
+        """Удаляет самые давно использованные файлы сверх бюджета."""
+        self._written = 0
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith((".lock", ".tmp")):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            # Блокировку может держать воркер, который сейчас рендерит
+            # этот вариант заново
+            self._remove_lock(path)
+            total -= size
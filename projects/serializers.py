@@ -1,50 +1,308 @@
-from bs4 import BeautifulSoup
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Manager, Prefetch
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
+from .images import FORMAT_PREFERENCE, format_of
 from .models import Article, Initiative, Project
+from .storage import image_storage
+
+# Поля модели, которые читают SerializerMethodField общих сериализаторов
+COMMON_FIELD_DEPENDENCIES = {
+    "time_create": ("time_create",),
+    "time_update": ("time_update",),
+    "srcset": ("srcset",),
+    "images": (
+        "srcset",
+        "image",
+        "image_webp",
+        "image_detail",
+        "image_detail_webp",
+    ),
+    # Поля таблицы деталей (DetailOwnerMixin)
+    "detail_text": ("detail",),
+    "json_blocks": ("detail",),
+}
+
+
+def split_query_list(value):
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """Оставляет в ответе только поля из ``?fields=`` и убирает поля из
+    ``?omit=``. Работает только на чтение: при записи нужны все поля.
+
+    Поля ``detail_only_fields`` в списках отдаются только по явному
+    ``?fields=``, иначе — лишь в детальном ответе.
+    """
 
+    pruned = False
+    detail_only_fields = ()
 
-class HTMLTableWrapperMixin:
-    def wrap_tables_in_html(self, html_content):
-        if not html_content:
-            return html_content
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
 
-        soup = BeautifulSoup(html_content, "html.parser")
-        tables = soup.find_all("table")
+        only = split_query_list(request.query_params.get("fields", ""))
+        omit = split_query_list(request.query_params.get("omit", ""))
+        if isinstance(self.parent, serializers.ListSerializer):
+            omit |= set(self.detail_only_fields) - only
+        if not only and not omit:
+            return fields
 
-        for table in tables:
-            if (
-                table.parent
-                and table.parent.name == "div"
-                and "custom-table-wrapper" in table.parent.get("class", [])
-            ):
+        for name, field in list(fields.items()):
+            if field.write_only:
                 continue
+            if (only and name not in only) or name in omit:
+                del fields[name]
+        self.pruned = True
+        return fields
+
+
+class QuerysetOptimizationMixin:
+    """Связи и колонки, которые сериализатор читает у каждого объекта.
+
+    Связи объявляются на классе сериализатора, а представления применяют
+    их через ``setup_queryset``, чтобы страница из N объектов стоила
+    постоянное число запросов, а не N. Если набор полей сокращен
+    (``SparseFieldsetMixin``), из БД читаются только нужные колонки,
+    а ненужные связи не подгружаются. Для полей без ``source``
+    (SerializerMethodField) нужные поля модели перечисляются
+    в ``field_dependencies``.
+    """
+
+    select_related = ()
+    prefetch_related = ()
+    field_dependencies = COMMON_FIELD_DEPENDENCIES
+
+    def required_lookups(self):
+        """Поля и связи модели, нужные для ответа, или None, если нужно
+        все."""
+        # Поля строятся лениво: pruned известен только после get_fields
+        readable_fields = list(self._readable_fields)
+        if not self.pruned:
+            return None
+
+        # time_update входит в ключ кеша фрагментов (FragmentCacheMixin)
+        lookups = {self.Meta.model._meta.pk.name, "time_update"}
+        for field in readable_fields:
+            if field.field_name in self.field_dependencies:
+                lookups.update(self.field_dependencies[field.field_name])
+            elif field.source != "*":
+                lookups.add(field.source.split(".")[0])
+            else:
+                return None
+        return lookups
+
+    def setup_queryset(self, queryset):
+        select_related = self.select_related
+        prefetch_related = self.prefetch_related
+
+        lookups = self.required_lookups()
+        if lookups is not None:
+            columns = [
+                field.name
+                for field in queryset.model._meta.concrete_fields
+                if field.name in lookups
+            ]
+            select_related = [
+                lookup
+                for lookup in select_related
+                if lookup.split("__")[0] in lookups
+            ]
+            # Связь из select_related не может быть отложенной
+            queryset = queryset.only(*columns, *select_related)
+            prefetch_related = [
+                lookup
+                for lookup in prefetch_related
+                if getattr(lookup, "prefetch_through", lookup).split("__")[0]
+                in lookups
+            ]
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+class FragmentCacheListSerializer(serializers.ListSerializer):
+    """Собирает список из фрагментов одним ``get_many``; сериализуются
+    только объекты, которых нет в кеше."""
+
+    def to_representation(self, data):
+        if not self.child.fragment_cache_enabled:
+            return super().to_representation(data)
+
+        items = list(data.all() if isinstance(data, Manager) else data)
+        keys = [self.child.fragment_key(item) for item in items]
+        cached = cache.get_many(keys)
+
+        missing = {}
+        representation = []
+        for item, key in zip(items, keys):
+            if key not in cached:
+                missing[key] = self.child.build_representation(item)
+            representation.append(
+                cached[key] if key in cached else missing[key]
+            )
+
+        if missing:
+            cache.set_many(missing, settings.FRAGMENT_CACHE_TIMEOUT)
+        return representation
+
 
-            wrapper = soup.new_tag("div", **{"class": "custom-table-wrapper"})
-            table.wrap(wrapper)
+class FragmentCacheMixin:
+    """Кеширует сериализованный словарь каждого объекта.
 
-        return str(soup)
+    Ключ — модель, pk, ``time_update`` и вариант ответа (набор полей
+    и хост для абсолютных URL). Изменение
+    объекта или его дочерних объектов обновляет ``time_update`` (см.
+    ``projects.signals``), поэтому устаревшие фрагменты не читаются.
+    Переопределять нужно ``build_representation``, а не
+    ``to_representation``; в Meta сериализатора указывается
+    ``list_serializer_class = FragmentCacheListSerializer``.
+    """
 
+    @property
+    def fragment_cache_enabled(self):
+        request = self.context.get("request")
+        return request is not None and request.method in SAFE_METHODS
 
-class ProjectSerializer(HTMLTableWrapperMixin, serializers.ModelSerializer):
+    @cached_property
+    def fragment_variant(self):
+        request = self.context["request"]
+        variant = (
+            [field.field_name for field in self._readable_fields],
+            request.build_absolute_uri("/"),
+        )
+        return hashlib.sha1(repr(variant).encode()).hexdigest()
+
+    def fragment_key(self, instance):
+        return (
+            f"fragment:{instance._meta.label_lower}:{instance.pk}:"
+            f"{instance.time_update.timestamp()}:{self.fragment_variant}"
+        )
+
+    def build_representation(self, instance):
+        return super().to_representation(instance)
+
+    def to_representation(self, instance):
+        if not self.fragment_cache_enabled:
+            return self.build_representation(instance)
+
+        key = self.fragment_key(instance)
+        representation = cache.get(key)
+        if representation is None:
+            representation = self.build_representation(instance)
+            cache.set(key, representation, settings.FRAGMENT_CACHE_TIMEOUT)
+        return representation
+
+
+class ImageSrcsetMixin:
+    def get_srcset(self, obj):
+        """Отдает srcset-строки вариантов по полям и форматам."""
+        return {
+            field: {
+                fmt: ", ".join(
+                    f"{self.build_media_url(name)} {width}w"
+                    for width, name in entries
+                )
+                for fmt, entries in formats.items()
+            }
+            for field, formats in (obj.srcset or {}).items()
+        }
+
+    def get_images(self, obj):
+        """URL полноразмерного изображения в каждом готовом формате:
+        ``{поле: {формат: url}}``, от самого компактного к самому
+        совместимому.
+
+        Формат выбирает браузер (``<picture>``/``<source type>``): Accept
+        JSON-запроса к API не говорит, какие форматы понимает ``<img>``.
+        """
+        images = {}
+
+        for field in obj.image_fields:
+            formats = (obj.srcset or {}).get(field)
+            if formats:
+                candidates = {
+                    fmt: entries[-1][1] for fmt, entries in formats.items()
+                }
+            else:
+                # Объекты, обработанные до появления манифеста, и объекты,
+                # задание которых еще не выполнено или упало: формат берем
+                # по расширению файла, PNG и GIF в <source> не попадают
+                candidates = {}
+                for name in (
+                    getattr(obj, f"{field}_webp").name,
+                    getattr(obj, field).name,
+                ):
+                    fmt = format_of(name)
+                    if fmt:
+                        candidates.setdefault(fmt, name)
+            images[field] = {
+                fmt: self.build_media_url(candidates[fmt])
+                for fmt in FORMAT_PREFERENCE
+                if candidates.get(fmt)
+            } or None
+
+        return images
+
+    def build_media_url(self, name):
+        url = image_storage.url(name)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+
+class ProjectSerializer(
+    SparseFieldsetMixin,
+    FragmentCacheMixin,
+    QuerysetOptimizationMixin,
+    ImageSrcsetMixin,
+    serializers.ModelSerializer,
+):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     initiative_ids = serializers.PrimaryKeyRelatedField(
         many=True, read_only=True, source="initiative_set"
     )
+    detail_text = serializers.CharField(required=False, allow_blank=True)
+    json_blocks = serializers.JSONField(required=False, allow_null=True)
     time_create = serializers.SerializerMethodField()
     time_update = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+
+    # Детали читаются одним JOIN только для детального ответа
+    select_related = ("detail",)
+    # Для initiative_ids нужны только ключи
+    prefetch_related = (
+        Prefetch(
+            "initiative_set",
+            queryset=Initiative.objects.only("id", "project_id"),
+        ),
+    )
+    detail_only_fields = ("detail_text", "json_blocks")
 
     class Meta:
         model = Project
         fields = "__all__"
+        list_serializer_class = FragmentCacheListSerializer
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        if "detail_text" in representation:
-            representation["detail_text"] = self.wrap_tables_in_html(
-                representation["detail_text"]
-            )
+    def build_representation(self, instance):
+        representation = super().build_representation(instance)
+        # HTML с обертками таблиц готовится при сохранении
+        # (ProjectDetail.save), здесь только подставляем сохраненное значение
+        if "detail_text" in representation and instance.detail_html:
+            representation["detail_text"] = instance.detail_html
         return representation
 
     @staticmethod
@@ -56,17 +314,37 @@ class ProjectSerializer(HTMLTableWrapperMixin, serializers.ModelSerializer):
         return int(obj.time_update.timestamp())
 
 
-class InitiativeSerializer(serializers.ModelSerializer):
+class InitiativeSerializer(
+    SparseFieldsetMixin,
+    FragmentCacheMixin,
+    QuerysetOptimizationMixin,
+    ImageSrcsetMixin,
+    serializers.ModelSerializer,
+):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
     article_ids = serializers.PrimaryKeyRelatedField(
         many=True, read_only=True, source="article_set"
     )
+    detail_text = serializers.CharField(required=False, allow_blank=True)
+    json_blocks = serializers.JSONField(required=False, allow_null=True)
     time_create = serializers.SerializerMethodField()
     time_update = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+
+    select_related = ("detail",)
+    prefetch_related = (
+        Prefetch(
+            "article_set",
+            queryset=Article.objects.only("id", "initiative_id"),
+        ),
+    )
+    detail_only_fields = ("detail_text", "json_blocks")
 
     class Meta:
         model = Initiative
         fields = "__all__"
+        list_serializer_class = FragmentCacheListSerializer
 
     @staticmethod
     def get_time_create(obj):
@@ -77,19 +355,28 @@ class InitiativeSerializer(serializers.ModelSerializer):
         return int(obj.time_update.timestamp())
 
 
-class ArticleSerializer(serializers.ModelSerializer):
+class ArticleSerializer(
+    SparseFieldsetMixin,
+    FragmentCacheMixin,
+    QuerysetOptimizationMixin,
+    ImageSrcsetMixin,
+    serializers.ModelSerializer,
+):
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    project_id = serializers.SerializerMethodField()
+    detail_text = serializers.CharField(required=False, allow_blank=True)
+    json_blocks = serializers.JSONField(required=False, allow_null=True)
     time_create = serializers.SerializerMethodField()
     time_update = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+
+    select_related = ("detail",)
+    detail_only_fields = ("detail_text", "json_blocks")
 
     class Meta:
         model = Article
         fields = "__all__"
-
-    @staticmethod
-    def get_project_id(obj):
-        return obj.initiative_id.project_id.id
+        list_serializer_class = FragmentCacheListSerializer
 
     @staticmethod
     def get_time_create(obj):
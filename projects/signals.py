@@ -0,0 +1,129 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from .cache import invalidate_model
+from .models import Article, ArticleCategory, Initiative, Project
+
+CACHED_MODELS = (Project, Initiative, Article, ArticleCategory)
+
+# Дочерняя модель -> внешние ключи на родителей, в ответах которых она
+# видна (initiative_ids и счетчики у проекта, article_ids и счетчик у
+# инициативы)
+PARENT_FIELDS = {
+    Initiative: ("project_id",),
+    Article: ("initiative_id", "project_id"),
+}
+
+
+def invalidate_model_cache(sender, **kwargs):
+    """Любая запись в модель делает ее кешированные значения устаревшими."""
+    invalidate_model(sender)
+
+
+def touch(model_class, counters=None, **filters):
+    """Обновляет time_update без сигналов: ключи кеша фрагментов
+    (FragmentCacheMixin) включают time_update.
+
+    ``counters`` — приращения денормализованных счетчиков, применяются
+    через F() в том же UPDATE, поэтому параллельные записи не теряются.
+    """
+    changes = {
+        name: F(name) + delta for name, delta in (counters or {}).items()
+    }
+    model_class.objects.filter(**filters).update(
+        time_update=timezone.now(), **changes
+    )
+
+
+def counters_of(instance, created):
+    """Вклад объекта в счетчики родителя."""
+    if not isinstance(instance, Initiative):
+        return {"articles_count": 1}
+    # Статьи переезжают вместе с инициативой. Счетчик берем из базы:
+    # в загруженном объекте он мог устареть
+    articles_count = 0
+    if not created:
+        articles_count = (
+            Initiative.objects.filter(pk=instance.pk)
+            .values_list("articles_count", flat=True)
+            .get()
+        )
+    return {"initiatives_count": 1, "articles_count": articles_count}
+
+
+def load_stored_parents(sender, instance, **kwargs):
+    """Перед переносом объекта читает из БД его текущих родителей.
+
+    Прежнего родителя ``touch_parents_on_save`` берет из
+    ``_loaded_state``, но значение там могло устареть (объект загружен
+    до переноса его инициативы) или отсутствовать (внешний ключ
+    отложен ``.only()`` и присвоен до первого обращения). Без значения из
+    БД перенос уменьшил бы счетчики не того родителя или ничьи.
+    """
+    loaded_state = getattr(instance, "_loaded_state", None)
+    if instance._state.adding or loaded_state is None:
+        return
+    attnames = [
+        sender._meta.get_field(field_name).attname
+        for field_name in PARENT_FIELDS[sender]
+    ]
+    if any(
+        name not in loaded_state or instance.has_changed(name)
+        for name in attnames
+    ):
+        loaded_state.update(
+            sender.objects.filter(pk=instance.pk).values(*attnames).get()
+        )
+
+
+def touch_parents_on_save(sender, instance, created, **kwargs):
+    for field_name in PARENT_FIELDS[sender]:
+        field = sender._meta.get_field(field_name)
+        current = getattr(instance, field.attname)
+        previous = None if created else instance.loaded_value(field.attname)
+        if previous == current:
+            continue
+        # Перенос к другому родителю меняет ответы и счетчики обоих
+        counters = counters_of(instance, created)
+        if previous is not None:
+            touch(
+                field.related_model,
+                {name: -delta for name, delta in counters.items()},
+                pk=previous,
+            )
+        touch(field.related_model, counters, pk=current)
+        if sender is Initiative and not created:
+            # Статьи хранят проект своей инициативы
+            Article.objects.filter(initiative_id=instance.pk).update(
+                project_id=current, time_update=timezone.now()
+            )
+            # update() не шлет сигналов: сбрасываем кеш ?project_id=
+            invalidate_model(Article)
+
+
+def touch_parents_on_delete(sender, instance, **kwargs):
+    # Статьи удаляемой инициативы удаляются каскадом раньше нее и сами
+    # уменьшают articles_count проекта
+    counters = (
+        {"initiatives_count": -1}
+        if sender is Initiative
+        else {"articles_count": -1}
+    )
+    for field_name in PARENT_FIELDS[sender]:
+        field = sender._meta.get_field(field_name)
+        touch(
+            field.related_model, counters, pk=getattr(instance, field.attname)
+        )
+
+
+# Подключаем только к нужным моделям: обработчик без sender отключил бы
+# быстрое удаление (fast delete) для всех остальных
+for model in CACHED_MODELS:
+    post_save.connect(invalidate_model_cache, sender=model)
+    post_delete.connect(invalidate_model_cache, sender=model)
+
+for model in PARENT_FIELDS:
+    pre_save.connect(load_stored_parents, sender=model)
+    post_save.connect(touch_parents_on_save, sender=model)
+    post_delete.connect(touch_parents_on_delete, sender=model)
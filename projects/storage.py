@@ -0,0 +1,65 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_NAME_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def content_hash(content):
+    """Считает sha256 файла по чанкам, не читая его в память целиком."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def is_content_addressed(name):
+    """Проверяет, что имя файла построено из хеша его содержимого."""
+    stem = os.path.basename(name or "").split(".", 1)[0]
+    return bool(HASH_NAME_RE.match(stem))
+
+
+@deconstructible(path="projects.storage.ContentAddressedStorage")
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с адресацией по содержимому.
+
+    Файл сохраняется как ``<каталог>/<ab>/<sha256>.<ext>``: одинаковые
+    изображения записываются один раз, а повторная загрузка возвращает
+    имя уже существующего файла. Каталог берется из переданного имени
+    (например, из ``upload_to``).
+    """
+
+    def hashed_name(self, name, digest):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f"{digest}{extension}")
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым файла в _save()
+        return name
+
+    def _save(self, name, content):
+        # Потоковый обработчик загрузок уже посчитал хеш по пути
+        digest = getattr(content, "sha256", None) or content_hash(content)
+        name = self.hashed_name(name, digest)
+        if self.exists(name):
+            return name
+
+        # Пишем под уникальным временным именем и атомарно переименовываем:
+        # параллельная загрузка того же файла запишет идентичное содержимое
+        tmp_name = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        try:
+            os.replace(self.path(tmp_name), self.path(name))
+        except OSError:
+            self.delete(tmp_name)
+            raise
+        return name
+
+
+image_storage = ContentAddressedStorage()
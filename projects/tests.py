@@ -1,3 +1,1895 @@
-# from django.test import TestCase
+import base64
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files import locks
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import SkipFile, StopUpload
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Max
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PilImage
+
+from .checks import check_shared_cache
+from .db_router import PrimaryReplicaRouter, reads_from_replica, replica_reads
+from .html_rewriter import (
+    AbsoluteImageSrc,
+    HTMLRewriter,
+    Transform,
+    WrapTables,
+)
+from .images import SUPPORTED_FORMATS, derivative_names, render_derivatives
+from .management.commands import bench_html_rewriter
+from .management.commands.collect_orphaned_media import (
+    QUARANTINE_DIR,
+    ReferenceIndex,
+    iter_media_files,
+)
+from .models import (
+    Article,
+    ArticleCategory,
+    ArticleDetail,
+    DerivativesStatus,
+    ImageDerivative,
+    ImageJob,
+    Initiative,
+    Project,
+    ProjectDetail,
+)
+from .resize_cache import ResizeCache
+from .serializers import ProjectSerializer
+from .storage import ContentAddressedStorage
+from .uploads import ImageUploadHandler
+from .views import create_filterset
+
+# Тесты не трогают настроенный кеш (по умолчанию — общий для процессов
+# каталог cache/django): cache.clear() в них чистит только этот locmem,
+# свой в каждом процессе параллельного запуска
+isolated_cache = override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "projects-tests",
+        }
+    }
+)
+
+
+# Реплика-зеркало (TEST MIRROR) — отдельное соединение и не видит данных
+# из незакоммиченной транзакции теста, поэтому чтения идут в основную базу
+@isolated_cache
+@override_settings(DATABASE_REPLICA=None)
+class ContentTestCase(TestCase):
+    """Проекты, инициативы и статьи без изображений."""
+
+    projects_count = 4
+    initiatives_per_project = 3
+    articles_per_initiative = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("author", password="password")
+        category = ArticleCategory.objects.create(title="Новости")
+        for project_index in range(cls.projects_count):
+            project = Project.objects.create(
+                title=f"Проект {project_index}",
+                detail_text="<table><tr><td>1</td></tr></table>",
+                user=cls.user,
+            )
+            for initiative_index in range(cls.initiatives_per_project):
+                initiative = Initiative.objects.create(
+                    title=f"Инициатива {initiative_index}",
+                    project_id=project,
+                )
+                # Через save(): он заполняет project_id и счетчики
+                for article_index in range(cls.articles_per_initiative):
+                    Article.objects.create(
+                        title=f"Статья {article_index}",
+                        initiative_id=initiative,
+                        cat_id=category,
+                    )
+
+    def setUp(self):
+        # Откат транзакции теста не сбрасывает версии моделей в кеше
+        cache.clear()
+
+
+class QueryBudgetTests(ContentTestCase):
+    """Число запросов на странице не зависит от ее размера."""
+
+    # Валидаторы для ETag, COUNT для пагинации и выборка страницы
+    list_queries = 3
+    # Валидаторы и выборка объекта
+    detail_queries = 2
+    # Плюс prefetch связей (initiative_ids, article_ids). У статей его нет:
+    # project_id хранится в строке статьи
+    article_prefetches = 0
+
+    def assertListQueries(self, url, prefetches=1):
+        for page_size in (1, 100):
+            cache.clear()
+            with self.assertNumQueries(self.list_queries + prefetches):
+                response = self.client.get(url, {"page_size": page_size})
+            self.assertEqual(response.status_code, 200)
+
+    def test_project_list(self):
+        self.assertListQueries("/api/v1/project/")
+
+    def test_initiative_list(self):
+        self.assertListQueries("/api/v1/initiative/")
+
+    def test_article_list(self):
+        self.assertListQueries(
+            "/api/v1/article/", prefetches=self.article_prefetches
+        )
+
+    def test_detail(self):
+        for model_class, url, prefetches in (
+            (Project, "/api/v1/project/{}/", 1),
+            (Initiative, "/api/v1/initiative/{}/", 1),
+            (Article, "/api/v1/article/{}/", self.article_prefetches),
+        ):
+            pk = model_class.objects.values_list("pk", flat=True).first()
+            queries = self.detail_queries + prefetches
+            with self.subTest(model=model_class.__name__):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(url.format(pk))
+                self.assertEqual(response.status_code, 200)
+
+
+class RelatedIdsTests(ContentTestCase):
+    def test_project_initiative_ids(self):
+        project = Project.objects.first()
+        response = self.client.get(f"/api/v1/project/{project.pk}/")
+        self.assertCountEqual(
+            response.json()["initiative_ids"],
+            project.initiative_set.values_list("pk", flat=True),
+        )
+
+    def test_initiative_article_ids(self):
+        initiative = Initiative.objects.first()
+        response = self.client.get(f"/api/v1/initiative/{initiative.pk}/")
+        self.assertCountEqual(
+            response.json()["article_ids"],
+            initiative.article_set.values_list("pk", flat=True),
+        )
+
+    def test_article_project_id(self):
+        response = self.client.get("/api/v1/article/", {"page_size": 100})
+        articles = Article.objects.select_related("initiative_id")
+        expected = {
+            article.pk: article.initiative_id.project_id_id
+            for article in articles
+        }
+        self.assertEqual(
+            {
+                row["id"]: row["project_id"]
+                for row in response.json()["results"]
+            },
+            expected,
+        )
+
+
+class SparseFieldsetTests(ContentTestCase):
+    def get_page(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {"page_size": 100, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"], [
+            query["sql"] for query in queries.captured_queries
+        ]
+
+    def test_fields(self):
+        results, queries = self.get_page(
+            "/api/v1/project/", fields="id,title,images"
+        )
+        self.assertEqual(set(results[0]), {"id", "title", "images"})
+        # Валидаторы, COUNT и страница: initiative_ids не запрошены
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('"detail_text"', queries[-1])
+        self.assertNotIn('"json_blocks"', queries[-1])
+
+    def test_omit(self):
+        results, queries = self.get_page(
+            "/api/v1/article/", omit="detail_text,json_blocks"
+        )
+        self.assertNotIn("detail_text", results[0])
+        self.assertNotIn("json_blocks", results[0])
+        self.assertIn("project_id", results[0])
+        self.assertNotIn('"detail_text"', queries[-1])
+
+    def test_project_detail_text_uses_rendered_html(self):
+        results, _ = self.get_page("/api/v1/project/", fields="detail_text")
+        self.assertIn("custom-table-wrapper", results[0]["detail_text"])
+
+    def test_related_ids_with_sparse_fields(self):
+        results, queries = self.get_page(
+            "/api/v1/initiative/", fields="id,article_ids"
+        )
+        self.assertEqual(
+            len(results[0]["article_ids"]), self.articles_per_initiative
+        )
+        self.assertEqual(len(queries), 4)
+
+
+class CursorPaginationTests(ContentTestCase):
+    url = "/api/v1/article/"
+
+    def walk(self, url, params):
+        ids = []
+        pages = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            pages.append(body)
+            ids.extend(row["id"] for row in body["results"])
+            url, params = body["pagination"]["next"], None
+        return ids, pages
+
+    def test_walk_all_pages(self):
+        ids, pages = self.walk(self.url, {"cursor": "", "page_size": 5})
+        expected = list(
+            Article.objects.order_by("time_create", "id").values_list(
+                "id", flat=True
+            )
+        )
+        self.assertEqual(ids, expected)
+        self.assertIsNone(pages[0]["pagination"]["previous"])
+        self.assertNotIn("count", pages[0]["pagination"])
+
+    def test_previous_page(self):
+        _, pages = self.walk(self.url, {"cursor": "", "page_size": 5})
+        response = self.client.get(pages[2]["pagination"]["previous"])
+        self.assertEqual(response.json()["results"], pages[1]["results"])
+
+    def test_delete_does_not_shift_pages(self):
+        first = self.client.get(self.url, {"cursor": "", "page_size": 5})
+        next_url = first.json()["pagination"]["next"]
+        Article.objects.filter(pk=first.json()["results"][0]["id"]).delete()
+        second = self.client.get(next_url)
+        self.assertNotIn(
+            first.json()["results"][-1]["id"],
+            [row["id"] for row in second.json()["results"]],
+        )
+        self.assertEqual(len(second.json()["results"]), 5)
+
+    def test_constant_queries(self):
+        _, pages = self.walk(self.url, {"cursor": "", "page_size": 5})
+        # Только страница: без COUNT, валидаторы из кеша (курсор в них
+        # не входит)
+        with self.assertNumQueries(1):
+            self.client.get(pages[-1]["pagination"]["previous"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+
+class CountCacheTests(ContentTestCase):
+    url = "/api/v1/article/"
+
+    def get_count(self, **params):
+        response = self.client.get(self.url, params)
+        return response.json()["pagination"]["count"]
+
+    def test_count_is_cached_per_filter(self):
+        total = Article.objects.count()
+        self.assertEqual(self.get_count(), total)
+        # Только страница: COUNT и валидаторы из кеша
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_count(page=2), total)
+
+        first_id = Article.objects.values_list("pk", flat=True).first()
+        with self.assertNumQueries(3):
+            self.assertEqual(self.get_count(id=first_id), 1)
+
+    def test_empty_in_filter(self):
+        for params in ({"project_id__in": ","}, {"id__in": ","}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["pagination"]["count"], 0)
+                self.assertEqual(response.json()["results"], [])
+
+        response = self.client.get(self.url, {"id__in": "a,b"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_write_invalidates_count(self):
+        total = Article.objects.count()
+        self.assertEqual(self.get_count(), total)
+        Article.objects.first().delete()
+        self.assertEqual(self.get_count(), total - 1)
+
+    def test_has_more_mode(self):
+        total = Article.objects.count()
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                self.url, {"count": "false", "page_size": total - 1}
+            )
+        pagination = response.json()["pagination"]
+        self.assertIsNone(pagination["count"])
+        self.assertTrue(pagination["has_more"])
+
+        response = self.client.get(pagination["next"])
+        pagination = response.json()["pagination"]
+        self.assertEqual(len(response.json()["results"]), 1)
+        self.assertFalse(pagination["has_more"])
+        self.assertIsNone(pagination["next"])
+        self.assertIsNotNone(pagination["previous"])
+
+
+class ResponseCacheTests(ContentTestCase):
+    def test_repeated_get_is_served_from_cache(self):
+        first = self.client.get("/api/v1/project/")
+        # Валидаторы для ETag тоже из кеша
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/v1/project/")
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_cached_body_matches_etag(self):
+        url = "/api/v1/project/"
+        first = self.client.get(url)
+        project = Project.objects.order_by("time_create", "id").first()
+        # Запись в обход сигналов не меняет версии моделей, а валидаторы
+        # посчитаны заново (например, вытеснены из кеша)
+        Project.objects.filter(pk=project.pk).update(
+            title="Новое название", time_update=timezone.now()
+        )
+
+        def fresh_validators(queryset, related_models=()):
+            aggregate = queryset.aggregate(
+                last_modified=Max("time_update"), count=Count("pk")
+            )
+            return aggregate["last_modified"], aggregate["count"]
+
+        with mock.patch(
+            "projects.views.cached_validators", side_effect=fresh_validators
+        ):
+            second = self.client.get(url)
+        self.assertNotEqual(first["ETag"], second["ETag"])
+        titles = {row["id"]: row["title"] for row in second.json()["results"]}
+        self.assertEqual(titles[project.pk], "Новое название")
+
+    def test_query_string_is_part_of_key(self):
+        self.client.get("/api/v1/project/")
+        # Страница и initiative_ids, валидаторы и COUNT из кеша
+        with self.assertNumQueries(2):
+            self.client.get("/api/v1/project/", {"page": 2})
+        # Форматы изображений из Accept на ответ не влияют
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/v1/project/", HTTP_ACCEPT="application/json, image/webp"
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_auth_scope_is_part_of_key(self):
+        self.client.get("/api/v1/project/")
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/v1/project/")
+        self.assertTrue(
+            any(
+                "projects_project" in q["sql"]
+                for q in queries.captured_queries
+            )
+        )
+
+    def test_child_change_invalidates_parent_listings(self):
+        article = Article.objects.select_related("initiative_id").first()
+        initiative = article.initiative_id
+        project_url = f"/api/v1/project/{initiative.project_id_id}/"
+        initiative_url = f"/api/v1/initiative/{initiative.pk}/"
+        self.client.get(project_url)
+        self.client.get(initiative_url)
+
+        article.delete()
+        response = self.client.get(initiative_url)
+        self.assertNotIn(article.pk, response.json()["article_ids"])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(project_url)
+        self.assertTrue(
+            any("LIMIT" in q["sql"] for q in queries.captured_queries)
+        )
+
+    def test_update_is_visible_immediately(self):
+        project = Project.objects.first()
+        self.client.get(f"/api/v1/project/{project.pk}/")
+        project.title = "Новое название"
+        project.save()
+        response = self.client.get(f"/api/v1/project/{project.pk}/")
+        self.assertEqual(response.json()["title"], "Новое название")
+
+
+class FragmentCacheTests(ContentTestCase):
+    url = "/api/v1/project/"
+
+    def count_serialized(self, **params):
+        build = ProjectSerializer.build_representation
+        with mock.patch.object(
+            ProjectSerializer,
+            "build_representation",
+            autospec=True,
+            side_effect=build,
+        ) as build_mock:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return build_mock.call_count, response.json()["results"]
+
+    def test_new_filter_reuses_fragments(self):
+        calls, results = self.count_serialized(page_size=100)
+        self.assertEqual(calls, self.projects_count)
+        ids = ",".join(str(row["id"]) for row in results[:2])
+        calls, _ = self.count_serialized(id__in=ids)
+        self.assertEqual(calls, 0)
+
+    def test_fieldset_is_part_of_key(self):
+        self.count_serialized(page_size=100)
+        calls, results = self.count_serialized(page_size=100, fields="id")
+        self.assertEqual(calls, self.projects_count)
+        self.assertEqual(set(results[0]), {"id"})
+
+    def test_own_change_refreshes_fragment(self):
+        self.count_serialized(page_size=100)
+        project = Project.objects.order_by("time_create", "id").first()
+        project.title = "Новое название"
+        project.save()
+        calls, results = self.count_serialized(page_size=100)
+        self.assertEqual(calls, 1)
+        self.assertEqual(results[0]["title"], "Новое название")
+
+    def test_child_change_refreshes_parent_fragment(self):
+        self.count_serialized(page_size=100)
+        project = Project.objects.order_by("time_create", "id").first()
+        initiative = Initiative.objects.create(
+            title="Новая инициатива", project_id=project
+        )
+        calls, results = self.count_serialized(page_size=100)
+        self.assertEqual(calls, 1)
+        self.assertIn(initiative.pk, results[0]["initiative_ids"])
+
+        other = Project.objects.exclude(pk=project.pk).first()
+        initiative.project_id = other
+        initiative.save()
+        calls, results = self.count_serialized(page_size=100)
+        self.assertEqual(calls, 2)
+        self.assertNotIn(initiative.pk, results[0]["initiative_ids"])
+
+
+class ImagesFieldTests(ContentTestCase):
+    def get_images(self, project, **headers):
+        response = self.client.get(
+            f"/api/v1/project/{project.pk}/", headers=headers
+        )
+        return response.json()["images"]
+
+    def test_all_formats_are_listed(self):
+        project = Project.objects.first()
+        Project.objects.filter(pk=project.pk).update(
+            image="images/ab/a.opt.jpg",
+            srcset={
+                "image": {
+                    "webp": [[640, "images/ab/a.w640.opt.webp"]],
+                    "jpeg": [[640, "images/ab/a.opt.jpg"]],
+                    "avif": [[640, "images/ab/a.opt.avif"]],
+                }
+            },
+        )
+        images = self.get_images(project, Accept="application/json")
+        self.assertEqual(list(images["image"]), ["avif", "webp", "jpeg"])
+        self.assertTrue(
+            images["image"]["avif"].endswith("/media/images/ab/a.opt.avif")
+        )
+        self.assertIsNone(images["image_detail"])
+
+    def test_legacy_image_without_manifest(self):
+        project = Project.objects.first()
+        Project.objects.filter(pk=project.pk).update(
+            image="images/legacy.jpg", image_webp="images/legacy.webp"
+        )
+        images = self.get_images(project)
+        self.assertEqual(list(images["image"]), ["webp", "jpeg"])
+
+    def test_pending_upload_is_listed_under_its_format(self):
+        project = Project.objects.first()
+        for image, expected in (
+            ("images/ab/a.png", None),
+            ("images/ab/a.webp", ["webp"]),
+            ("images/ab/a.avif", ["avif"]),
+            ("images/ab/a.JPEG", ["jpeg"]),
+        ):
+            with self.subTest(image=image):
+                # Задание еще не выполнено или упало: манифеста нет
+                Project.objects.filter(pk=project.pk).update(
+                    image=image, image_webp="", srcset={}
+                )
+                cache.clear()
+                images = self.get_images(project)["image"]
+                self.assertEqual(images and list(images), expected)
+
+
+class ConditionalGetTests(ContentTestCase):
+    def assertNotModified(self, url, **headers):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header("Last-Modified"))
+        # Валидаторы из кеша: 304 без запросов к БД
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                url,
+                headers={
+                    "If-None-Match": response["ETag"],
+                    "If-Modified-Since": response["Last-Modified"],
+                    **headers,
+                },
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+        return response
+
+    def test_list_not_modified(self):
+        self.assertNotModified("/api/v1/article/?page_size=5")
+
+    def test_detail_not_modified(self):
+        project = Project.objects.first()
+        self.assertNotModified(f"/api/v1/project/{project.pk}/")
+
+    def test_change_updates_etag(self):
+        url = "/api/v1/project/"
+        etag = self.client.get(url)["ETag"]
+        project = Project.objects.first()
+        project.title = "Новое название"
+        project.save()
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_delete_updates_etag(self):
+        url = "/api/v1/article/"
+        etag = self.client.get(url)["ETag"]
+        Article.objects.order_by("time_update").first().delete()
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_does_not_depend_on_image_accept(self):
+        url = "/api/v1/project/"
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(
+            url,
+            headers={
+                "If-None-Match": etag,
+                "Accept": "application/json, image/avif",
+            },
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_object(self):
+        response = self.client.get("/api/v1/project/0/")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class FilterTests(ContentTestCase):
+    def get_ids(self, url, **params):
+        response = self.client.get(url, {"page_size": 100, **params})
+        self.assertEqual(response.status_code, 200)
+        return {row["id"] for row in response.json()["results"]}
+
+    def test_filterset_is_built_once(self):
+        self.assertIs(create_filterset(Article), create_filterset(Article))
+
+    def test_relation_filters(self):
+        project = Project.objects.first()
+        self.assertEqual(
+            self.get_ids("/api/v1/initiative/", project_id=project.pk),
+            set(project.initiative_set.values_list("pk", flat=True)),
+        )
+        initiatives = list(Initiative.objects.values_list("pk", flat=True)[:2])
+        self.assertEqual(
+            self.get_ids(
+                "/api/v1/article/",
+                initiative_id__in=",".join(map(str, initiatives)),
+            ),
+            set(
+                Article.objects.filter(
+                    initiative_id__in=initiatives
+                ).values_list("pk", flat=True)
+            ),
+        )
+
+    def test_relation_filter_does_not_validate_with_query(self):
+        category = ArticleCategory.objects.get()
+        # Валидаторы, COUNT и страница
+        with self.assertNumQueries(3):
+            self.client.get("/api/v1/article/", {"cat_id": category.pk})
+
+    def test_time_range(self):
+        project = Project.objects.order_by("time_create").last()
+        Project.objects.exclude(pk=project.pk).update(
+            time_create=project.time_create - timedelta(days=1)
+        )
+        timestamp = int(project.time_create.timestamp())
+        self.assertEqual(
+            self.get_ids("/api/v1/project/", time_create__gte=timestamp),
+            {project.pk},
+        )
+        self.assertNotIn(
+            project.pk,
+            self.get_ids("/api/v1/project/", time_create__lte=timestamp - 1),
+        )
+
+    def test_drafts_are_visible_only_to_staff(self):
+        draft = Project.objects.first()
+        draft.is_published = False
+        draft.save()
+        self.assertNotIn(draft.pk, self.get_ids("/api/v1/project/"))
+        self.assertEqual(
+            self.get_ids("/api/v1/project/", is_published="false"), set()
+        )
+
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(
+            self.get_ids("/api/v1/project/", is_published="false"),
+            {draft.pk},
+        )
+        self.assertNotIn(draft.pk, self.get_ids("/api/v1/project/"))
+
+
+class ReplicaRoutingTests(ContentTestCase):
+    def capture_reads(self, method, url, **kwargs):
+        """Для каждого чтения модели приложения запоминает, разрешил ли
+        роутер реплику."""
+        decisions = []
+        original = PrimaryReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            if model._meta.app_label == "projects":
+                decisions.append(reads_from_replica())
+            return original(router, model, **hints)
+
+        with mock.patch.object(
+            PrimaryReplicaRouter, "db_for_read", db_for_read
+        ):
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertTrue(decisions)
+        return response, decisions
+
+    def test_get_reads_from_replica(self):
+        project = Project.objects.first()
+        for url in ("/api/v1/article/", f"/api/v1/project/{project.pk}/"):
+            response, decisions = self.capture_reads("get", url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(all(decisions))
+            self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_write_pins_reads_to_primary(self):
+        self.client.force_login(self.user)
+        project = Project.objects.first()
+        url = f"/api/v1/project/{project.pk}/"
+        response, decisions = self.capture_reads(
+            "patch",
+            url,
+            data={"title": "Новое название"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(decisions))
+        self.assertEqual(
+            response.cookies[settings.REPLICA_PIN_COOKIE]["max-age"],
+            settings.REPLICA_PIN_SECONDS,
+        )
+
+        # Cookie осталась у клиента: следующий GET читает основную базу
+        response, decisions = self.capture_reads("get", url)
+        self.assertFalse(any(decisions))
+        self.assertEqual(response.json()["title"], "Новое название")
+
+    def test_pinned_get_bypasses_caches(self):
+        self.client.force_login(self.user)
+        project = Project.objects.first()
+        url = f"/api/v1/project/{project.pk}/"
+        list_url = f"/api/v1/project/?id={project.pk}"
+        response = self.client.patch(
+            url,
+            data={"title": "Новое название"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        # Другой клиент без cookie читает отстающую реплику и кеширует
+        # старое состояние под новыми версиями моделей
+        other = Client()
+        other.force_login(self.user)
+        written = Project.objects.filter(pk=project.pk)
+        fresh = written.values("title", "time_update").get()
+        written.update(title=project.title, time_update=project.time_update)
+        for stale_url in (url, list_url):
+            other.get(stale_url)
+        written.update(**fresh)
+        self.assertEqual(other.get(url).json()["title"], project.title)
+
+        # Писавший клиент видит свою запись
+        self.assertEqual(
+            self.client.get(url).json()["title"], "Новое название"
+        )
+        response = self.client.get(list_url)
+        self.assertEqual(
+            response.json()["results"][0]["title"], "Новое название"
+        )
+
+    @override_settings(DATABASE_REPLICA="replica")
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+
+        def route():
+            with replica_reads():
+                aliases = [
+                    router.db_for_read(Article),
+                    router.db_for_read(User),
+                ]
+                router.db_for_write(Article)
+                aliases.append(router.db_for_read(Article))
+            aliases.append(router.db_for_read(Article))
+            return aliases
+
+        # Чистый контекст, как в начале запроса
+        self.assertEqual(
+            contextvars.Context().run(route),
+            ["replica", "default", "default", "default"],
+        )
+
+
+class DenormalizedCountersTests(ContentTestCase):
+    def assertCounters(self):
+        for project in Project.objects.all():
+            self.assertEqual(
+                project.initiatives_count, project.initiative_set.count()
+            )
+            self.assertEqual(
+                project.articles_count,
+                Article.objects.filter(
+                    initiative_id__project_id=project
+                ).count(),
+            )
+        for initiative in Initiative.objects.all():
+            self.assertEqual(
+                initiative.articles_count, initiative.article_set.count()
+            )
+        for article in Article.objects.select_related("initiative_id"):
+            self.assertEqual(
+                article.project_id_id, article.initiative_id.project_id_id
+            )
+
+    def test_create_and_delete(self):
+        self.assertCounters()
+        project = Project.objects.first()
+        self.assertEqual(project.initiatives_count, 3)
+        self.assertEqual(project.articles_count, 6)
+
+        initiative = Initiative.objects.create(
+            title="Новая", project_id=project
+        )
+        Article.objects.create(
+            title="Новая",
+            initiative_id=initiative,
+            cat_id=ArticleCategory.objects.get(),
+        )
+        self.assertCounters()
+
+        Article.objects.filter(initiative_id=initiative).first().delete()
+        initiative.delete()
+        Initiative.objects.filter(project_id=project).first().delete()
+        self.assertCounters()
+
+    def test_reparent(self):
+        first, second = Project.objects.all()[:2]
+        article = Article.objects.filter(project_id=first).first()
+        article.initiative_id = Initiative.objects.filter(
+            project_id=second
+        ).first()
+        article.save()
+        self.assertEqual(article.project_id, second)
+        self.assertCounters()
+
+        initiative = Initiative.objects.filter(project_id=first).first()
+        initiative.project_id = second
+        initiative.save()
+        self.assertCounters()
+
+    def test_reparent_deferred_parent(self):
+        first, second = Project.objects.all()[:2]
+        # Внешние ключи не загружены: прежнего родителя знает только БД
+        article = (
+            Article.objects.filter(project_id=first).only("title").first()
+        )
+        article.initiative_id = Initiative.objects.filter(
+            project_id=second
+        ).first()
+        article.save()
+        self.assertCounters()
+
+        initiative = (
+            Initiative.objects.filter(project_id=first).only("title").first()
+        )
+        initiative.project_id = second
+        initiative.save()
+        self.assertCounters()
+
+    def test_stale_instances_keep_counters(self):
+        project = Project.objects.first()
+        initiative = Initiative.objects.filter(project_id=project).first()
+        article = Article.objects.filter(initiative_id=initiative).first()
+        # Счетчики меняются в БД после загрузки объектов
+        new_initiative = Initiative.objects.create(
+            title="Новая", project_id=project
+        )
+        Article.objects.create(
+            title="Новая",
+            initiative_id=initiative,
+            cat_id=ArticleCategory.objects.get(),
+        )
+
+        for instance in (project, initiative, article):
+            instance.title = "Новое название"
+            instance.save()
+        self.assertCounters()
+        self.assertEqual(
+            Project.objects.get(pk=project.pk).title, "Новое название"
+        )
+
+        # Перенос инициативы с устаревшим articles_count
+        initiative.project_id = Project.objects.exclude(pk=project.pk)[0]
+        initiative.save()
+        self.assertCounters()
+        new_initiative.delete()
+        self.assertCounters()
+
+    def test_article_loaded_before_initiative_moved(self):
+        first, second = Project.objects.all()[:2]
+        initiative = Initiative.objects.filter(project_id=first).first()
+        article, other = Article.objects.filter(initiative_id=initiative)
+        initiative.project_id = second
+        initiative.save()
+
+        # project_id статьи устарел: обычное сохранение его не пишет
+        article.title = "Новое название"
+        article.save()
+        self.assertCounters()
+        self.assertEqual(
+            set(
+                Article.objects.filter(project_id=second).values_list(
+                    "pk", flat=True
+                )
+            ),
+            set(
+                Article.objects.filter(
+                    initiative_id__project_id=second
+                ).values_list("pk", flat=True)
+            ),
+        )
+
+        # Перенос в инициативу того проекта, который статья помнит
+        other.initiative_id = Initiative.objects.filter(
+            project_id=first
+        ).first()
+        other.save()
+        self.assertEqual(Article.objects.get(pk=other.pk).project_id, first)
+        self.assertCounters()
+
+        stdout = StringIO()
+        call_command("repair_counters", "--check", stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(line.endswith("расхождений 0") for line in lines))
+
+    def test_reparent_invalidates_project_filter(self):
+        first, second = Project.objects.all()[:2]
+        url = "/api/v1/article/"
+        for project in (first, second):
+            self.client.get(url, {"project_id": project.pk})
+
+        initiative = Initiative.objects.filter(project_id=first).first()
+        initiative.project_id = second
+        initiative.save()
+        for project in (first, second):
+            response = self.client.get(url, {"project_id": project.pk})
+            self.assertEqual(
+                response.json()["pagination"]["count"],
+                Article.objects.filter(project_id=project).count(),
+            )
+
+    def test_api_counters_and_project_filter(self):
+        project = Project.objects.first()
+        response = self.client.get(f"/api/v1/project/{project.pk}/")
+        self.assertEqual(response.json()["initiatives_count"], 3)
+        self.assertEqual(response.json()["articles_count"], 6)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/api/v1/article/", {"project_id": project.pk}
+            )
+        self.assertEqual(response.json()["pagination"]["count"], 6)
+        self.assertFalse(
+            any("JOIN" in q["sql"] for q in queries.captured_queries)
+        )
+
+    def test_repair(self):
+        Project.objects.update(initiatives_count=0, articles_count=100)
+        Initiative.objects.update(articles_count=0)
+        article = Article.objects.first()
+        Article.objects.filter(pk=article.pk).update(
+            project_id=Project.objects.exclude(
+                pk=article.project_id_id
+            ).first()
+        )
+        call_command("repair_counters", "--check", stdout=StringIO())
+        self.assertEqual(
+            Initiative.objects.filter(articles_count=0).count(), 12
+        )
+
+        call_command("repair_counters", stdout=StringIO())
+        self.assertCounters()
+
+
+class DetailTableTests(ContentTestCase):
+    detail_fields = {"detail_text", "json_blocks"}
+
+    @staticmethod
+    def reads_details(queries):
+        tables = ("projectdetail", "initiativedetail", "articledetail")
+        return any(
+            table in query["sql"]
+            for query in queries.captured_queries
+            for table in tables
+        )
+
+    def test_list_does_not_read_details(self):
+        for url in ("/api/v1/project/", "/api/v1/article/"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse(
+                self.detail_fields & set(response.json()["results"][0])
+            )
+            self.assertFalse(self.reads_details(queries))
+
+    def test_list_details_on_request(self):
+        response = self.client.get(
+            "/api/v1/project/", {"fields": "id,detail_text"}
+        )
+        self.assertIn(
+            "custom-table-wrapper",
+            response.json()["results"][0]["detail_text"],
+        )
+
+    def test_detail_response(self):
+        project = Project.objects.first()
+        response = self.client.get(f"/api/v1/project/{project.pk}/")
+        self.assertLessEqual(self.detail_fields, set(response.json()))
+        self.assertIn("custom-table-wrapper", response.json()["detail_text"])
+
+    def test_backfill_refreshes_cached_responses(self):
+        project = Project.objects.first()
+        url = f"/api/v1/project/{project.pk}/"
+        list_url = "/api/v1/project/"
+        self.client.get(url)
+        self.client.get(list_url, {"fields": "id,detail_text"})
+
+        # Данные, сохраненные до появления detail_html
+        ProjectDetail.objects.filter(owner=project).update(
+            detail_text="<table><tr><td>new</td></tr></table>",
+            detail_html="",
+        )
+        call_command("render_detail_text", stdout=StringIO())
+
+        self.assertIn("new", self.client.get(url).json()["detail_text"])
+        response = self.client.get(list_url, {"fields": "id,detail_text"})
+        detail_texts = {
+            row["id"]: row["detail_text"] for row in response.json()["results"]
+        }
+        self.assertIn("custom-table-wrapper", detail_texts[project.pk])
+        self.assertIn("new", detail_texts[project.pk])
+
+    def test_backfill_in_batches(self):
+        ProjectDetail.objects.update(detail_html="")
+        total = ProjectDetail.objects.exclude(detail_text="").count()
+        self.assertGreater(total, 2)
+        stdout = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                "render_detail_text", "--batch-size", "2", stdout=stdout
+            )
+        self.assertIn(f"Обновлено проектов: {total}", stdout.getvalue())
+        self.assertFalse(
+            ProjectDetail.objects.exclude(detail_text="")
+            .filter(detail_html="")
+            .exists()
+        )
+        # Каждая пачка читается отдельным запросом с LIMIT по pk
+        reads = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith("SELECT")
+            and "projects_projectdetail" in query["sql"]
+        ]
+        self.assertEqual(len(reads), -(-total // 2) + 1)
+        self.assertTrue(all("LIMIT 2" in sql for sql in reads))
+
+    def test_lazy_loading(self):
+        project = Project.objects.first()
+        with self.assertNumQueries(1):
+            self.assertIn("<table>", project.detail_text)
+        # Детали не загружали: сохраняется только строка проекта
+        project = Project.objects.first()
+        project.title = "Новое название"
+        with CaptureQueriesContext(connection) as queries:
+            project.save()
+        self.assertFalse(self.reads_details(queries))
+
+    def test_write_through_api(self):
+        self.client.force_login(self.user)
+        project = Project.objects.first()
+        response = self.client.patch(
+            f"/api/v1/project/{project.pk}/",
+            data={
+                "detail_text": '<img src="../media/a.jpg"><table></table>',
+                "json_blocks": [{"type": "text"}],
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        detail = Project.objects.get(pk=project.pk).detail
+        self.assertIn("http", detail.detail_text)
+        self.assertIn("custom-table-wrapper", detail.detail_html)
+        self.assertEqual(detail.json_blocks, [{"type": "text"}])
+
+        article = Article.objects.create(
+            title="Новая",
+            initiative_id=Initiative.objects.first(),
+            cat_id=ArticleCategory.objects.get(),
+            json_blocks={"blocks": []},
+        )
+        self.assertEqual(
+            ArticleDetail.objects.get(owner=article).json_blocks,
+            {"blocks": []},
+        )
+
+
+class ImageJobTests(ContentTestCase):
+    source = "images/ab/source.jpg"
+
+    def setUp(self):
+        super().setUp()
+        self.project = Project.objects.first()
+        Project.objects.filter(pk=self.project.pk).update(image=self.source)
+        self.project.refresh_from_db()
+        ImageJob.enqueue(self.project, ["image"])
+
+    def result(self):
+        return {
+            "jpeg": "images/ab/source.opt.jpg",
+            "webp": "images/ab/source.opt.webp",
+            "width": 800,
+            "variants": [
+                {
+                    "format": "webp",
+                    "width": 320,
+                    "height": 240,
+                    "name": "images/ab/source.w320.opt.webp",
+                }
+            ],
+            "meta": {"width": 800, "height": 600},
+        }
+
+    def test_claim(self):
+        (job,) = ImageJob.claim(10, "host:1")
+        self.assertEqual(job.status, ImageJob.Status.RUNNING)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.worker, "host:1")
+        self.assertIsNotNone(job.claimed_at)
+        # Второй воркер не получает уже взятое задание
+        self.assertEqual(ImageJob.claim(10, "host:2"), [])
+
+    def test_requeue_only_expired_leases(self):
+        (job,) = ImageJob.claim(10, "host:1")
+        lease = timedelta(minutes=15)
+        # Воркер жив: задание остается за ним
+        self.assertEqual(ImageJob.requeue_expired(lease), 0)
+        self.assertEqual(ImageJob.claim(10, "host:2"), [])
+
+        ImageJob.objects.filter(pk=job.pk).update(
+            claimed_at=timezone.now() - lease - timedelta(seconds=1)
+        )
+        self.assertEqual(ImageJob.requeue_expired(lease), 1)
+        (job,) = ImageJob.claim(10, "host:2")
+        self.assertEqual(job.worker, "host:2")
+        self.assertEqual(job.attempts, 2)
+
+    def test_complete(self):
+        (job,) = ImageJob.claim(10)
+        job.complete(self.result())
+
+        self.assertFalse(ImageJob.objects.exists())
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual(project.image.name, "images/ab/source.opt.jpg")
+        self.assertEqual(project.image_webp.name, "images/ab/source.opt.webp")
+        self.assertEqual(project.derivatives_status, DerivativesStatus.READY)
+        self.assertEqual(project.image_meta["image"]["width"], 800)
+        self.assertEqual(
+            project.srcset["image"]["webp"][0],
+            [320, "images/ab/source.w320.opt.webp"],
+        )
+        self.assertTrue(
+            ImageDerivative.objects.filter(
+                original="images/ab/source.opt.jpg", width=320
+            ).exists()
+        )
+
+    def test_complete_after_field_changed(self):
+        (job,) = ImageJob.claim(10)
+        Project.objects.filter(pk=self.project.pk).update(
+            image="images/cd/other.jpg"
+        )
+        job.complete(self.result())
+        # Результат для прежнего файла в объект не записывается
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual(project.image.name, "images/cd/other.jpg")
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_retry_with_backoff(self):
+        (job,) = ImageJob.claim(10, "host:1")
+        job.fail("OSError", max_attempts=2, retry_delay=60)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.Status.PENDING)
+        self.assertEqual(job.worker, "")
+        self.assertGreater(
+            job.available_at, timezone.now() + timedelta(seconds=50)
+        )
+        # До истечения задержки задание не берется
+        self.assertEqual(ImageJob.claim(10), [])
+
+        ImageJob.objects.update(available_at=timezone.now())
+        (job,) = ImageJob.claim(10)
+        job.fail("OSError", max_attempts=2, retry_delay=60)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageJob.Status.FAILED)
+        self.assertEqual(
+            Project.objects.get(pk=self.project.pk).derivatives_status,
+            DerivativesStatus.FAILED,
+        )
+
+    def test_backoff_doubles(self):
+        (job,) = ImageJob.claim(10)
+        ImageJob.objects.filter(pk=job.pk).update(attempts=3)
+        job.attempts = 3
+        started = timezone.now()
+        job.fail("OSError", max_attempts=5, retry_delay=10)
+        delay = job.available_at - started
+        self.assertGreaterEqual(delay, timedelta(seconds=40))
+        self.assertLess(delay, timedelta(seconds=41))
+
+
+class ChangeTrackingTests(ContentTestCase):
+    def test_refresh_from_db_resets_tracking(self):
+        project = Project.objects.first()
+        Project.objects.filter(pk=project.pk).update(
+            image="images/ab/source.jpg"
+        )
+        project.refresh_from_db()
+        self.assertFalse(project.has_changed("image"))
+
+        # Воркер записал готовую производную
+        Project.objects.filter(pk=project.pk).update(
+            image="images/ab/source.opt.jpg"
+        )
+        project.refresh_from_db(fields=["image", "image_webp"])
+        project.title = "Новое название"
+        project.save()
+
+        self.assertFalse(ImageJob.objects.exists())
+        self.assertEqual(
+            Project.objects.get(pk=project.pk).derivatives_status,
+            DerivativesStatus.READY,
+        )
+
+    def test_deferred_field_is_tracked_after_loading(self):
+        project = Project.objects.only("id", "title").first()
+        self.assertEqual(project.image.name, "")
+        project.image = "images/ab/new.jpg"
+        self.assertTrue(project.has_changed("image"))
+
+    def test_change_is_detected_after_refresh(self):
+        project = Project.objects.first()
+        project.refresh_from_db()
+        project.image = "images/ab/new.jpg"
+        project.save()
+        self.assertEqual(ImageJob.objects.get().source, "images/ab/new.jpg")
+
+
+def image_bytes(fmt="JPEG", size=(64, 48), color=(200, 40, 40)):
+    buffer = BytesIO()
+    PilImage.new("RGB", size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class TemporaryMediaMixin:
+    """MEDIA_ROOT во временном каталоге на время теста."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+    def media_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media_root)
+            for directory, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+
+@isolated_cache
+class ContentAddressedStorageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage(location=self.media_root)
+        self.content = image_bytes()
+        self.digest = hashlib.sha256(self.content).hexdigest()
+
+    def test_name_is_content_hash(self):
+        name = self.storage.save("images/photo.JPG", ContentFile(self.content))
+        self.assertEqual(name, f"images/{self.digest[:2]}/{self.digest}.jpg")
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), self.content)
+
+    def test_duplicate_is_stored_once(self):
+        first = self.storage.save("images/a.jpg", ContentFile(self.content))
+        with mock.patch.object(FileSystemStorage, "_save") as save_mock:
+            second = self.storage.save(
+                "images/b.jpg", ContentFile(self.content)
+            )
+        self.assertEqual(first, second)
+        # Существующий файл не перезаписывается
+        save_mock.assert_not_called()
+        self.assertEqual(self.media_files(), [first])
+
+    def test_write_goes_through_temporary_file(self):
+        with mock.patch(
+            "projects.storage.os.replace", wraps=os.replace
+        ) as replace_mock:
+            name = self.storage.save("images/a.jpg", ContentFile(self.content))
+        (tmp_path, target), _ = replace_mock.call_args
+        self.assertEqual(target, self.storage.path(name))
+        self.assertEqual(os.path.dirname(tmp_path), os.path.dirname(target))
+        self.assertTrue(tmp_path.endswith(".tmp"))
+        # Временный файл переименован, а не оставлен рядом
+        self.assertEqual(self.media_files(), [name])
+
+    def test_failed_write_leaves_no_file(self):
+        with mock.patch(
+            "projects.storage.os.replace", side_effect=OSError
+        ), self.assertRaises(OSError):
+            self.storage.save("images/a.jpg", ContentFile(self.content))
+        # Ни целевого, ни временного файла
+        self.assertEqual(self.media_files(), [])
+
+    def test_precomputed_digest_is_used(self):
+        content = ContentFile(self.content)
+        content.sha256 = "f" * 64
+        name = self.storage.save("images/a.jpg", content)
+        self.assertEqual(name, f"images/ff/{'f' * 64}.jpg")
+
+
+@isolated_cache
+class DerivativeNamesTests(TemporaryMediaMixin, TestCase):
+    def test_names_never_match_source(self):
+        digest = "a" * 64
+        for extension in ("jpg", "png", "webp", "avif"):
+            source = f"images/aa/{digest}.{extension}"
+            with self.subTest(source=source):
+                names = derivative_names(source, ("avif", "webp", "jpeg"))
+                self.assertNotIn(source, names.values())
+
+    def test_webp_upload_keeps_original(self):
+        content = image_bytes("WEBP")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/v1/upload/",
+                {"file": ContentFile(content, name="photo.webp")},
+            )
+        self.assertEqual(response.status_code, 200)
+        source = ImageJob.objects.get().source
+        self.assertTrue(source.endswith(".webp"))
+
+        result = render_derivatives(
+            self.media_root, source, widths=(32,), formats=("webp", "jpeg")
+        )
+        self.assertNotEqual(result["webp"], source)
+        with open(os.path.join(self.media_root, source), "rb") as file:
+            self.assertEqual(file.read(), content)
+        for name in (result["webp"], result["jpeg"]):
+            self.assertTrue(
+                os.path.exists(os.path.join(self.media_root, name))
+            )
+
+
+@isolated_cache
+class RenderDerivativesTests(TemporaryMediaMixin, TestCase):
+    source = f"images/aa/{'a' * 64}.png"
+
+    def setUp(self):
+        super().setUp()
+        path = os.path.join(self.media_root, self.source)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as file:
+            file.write(image_bytes("PNG", size=(200, 100)))
+
+    def test_avif_derivatives(self):
+        self.assertIn("avif", SUPPORTED_FORMATS)
+        result = render_derivatives(
+            self.media_root,
+            self.source,
+            widths=(100,),
+            formats=("avif", "webp", "jpeg"),
+        )
+        self.assertTrue(result["avif"].endswith(".opt.avif"))
+        avif_names = [result["avif"]] + [
+            variant["name"]
+            for variant in result["variants"]
+            if variant["format"] == "avif"
+        ]
+        self.assertEqual(len(avif_names), 2)
+        for name in avif_names:
+            with PilImage.open(os.path.join(self.media_root, name)) as image:
+                self.assertEqual(image.format, "AVIF")
+
+    def test_image_meta(self):
+        # Синий фон с красным квадратом в четверть площади
+        image = PilImage.new("RGB", (400, 200), (20, 40, 220))
+        image.paste((220, 30, 30), (0, 0, 200, 100))
+        with open(os.path.join(self.media_root, self.source), "wb") as file:
+            image.save(file, format="PNG")
+
+        result = render_derivatives(
+            self.media_root,
+            self.source,
+            formats=("webp", "jpeg"),
+            max_dimension=300,
+        )
+        meta = result["meta"]
+        # Размеры после вписывания в max_dimension
+        self.assertEqual((meta["width"], meta["height"]), (300, 150))
+        red, green, blue = bytes.fromhex(meta["color"].removeprefix("#"))
+        self.assertGreater(blue, 180)
+        self.assertLess(red, 60)
+
+        prefix = "data:image/jpeg;base64,"
+        self.assertTrue(meta["lqip"].startswith(prefix))
+        lqip = base64.b64decode(meta["lqip"].removeprefix(prefix))
+        with PilImage.open(BytesIO(lqip)) as placeholder:
+            self.assertEqual(placeholder.format, "JPEG")
+            self.assertEqual(placeholder.size, (16, 8))
+
+        # Повторная обработка того же содержимого считает заглушку по
+        # готовым производным
+        again = render_derivatives(
+            self.media_root,
+            self.source,
+            formats=("webp", "jpeg"),
+            max_dimension=300,
+        )
+        self.assertEqual(again["meta"]["width"], 300)
+        # Цвет считан с JPEG и может отличаться на единицы
+        red, green, blue = bytes.fromhex(
+            again["meta"]["color"].removeprefix("#")
+        )
+        self.assertGreater(blue, 180)
+        self.assertLess(red, 60)
+        self.assertTrue(again["meta"]["lqip"].startswith(prefix))
+
+
+@isolated_cache
+class ResizeCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.resize_cache = ResizeCache(directory, 10 * 1024 * 1024)
+
+    def render(self, key):
+        def write(path):
+            with open(path, "wb") as file:
+                file.write(b"0" * 100)
+
+        self.resize_cache.open_or_render(key, "jpg", write).close()
+        return self.resize_cache.path_for(key, "jpg")
+
+    def test_evict_keeps_held_locks(self):
+        held, free = self.render("held"), self.render("free")
+        self.resize_cache.max_bytes = 0
+        with open(f"{held}.lock", "ab") as lock_file:
+            # Другой воркер рендерит этот вариант
+            locks.lock(lock_file, locks.LOCK_EX)
+            self.resize_cache.evict()
+            self.assertFalse(os.path.exists(held))
+            self.assertTrue(os.path.exists(f"{held}.lock"))
+            locks.unlock(lock_file)
+        self.assertFalse(os.path.exists(free))
+        self.assertFalse(os.path.exists(f"{free}.lock"))
+
+    def test_lock_removed_while_waiting_is_retaken(self):
+        path = self.resize_cache.path_for("key", "jpg")
+        os.makedirs(os.path.dirname(path))
+        original = locks.lock
+        removed = []
+
+        def lock(file, flags):
+            # Вытеснение удалило блокировку, пока мы ее ждали
+            if not removed:
+                removed.append(True)
+                os.remove(f"{path}.lock")
+            return original(file, flags)
+
+        with mock.patch.object(locks, "lock", lock):
+            lock_file = self.resize_cache._lock(path)
+        with lock_file:
+            self.assertEqual(
+                os.fstat(lock_file.fileno()).st_ino,
+                os.stat(f"{path}.lock").st_ino,
+            )
+
+
+@isolated_cache
+class ResizeImageTests(TemporaryMediaMixin, TestCase):
+    hashed = f"images/aa/{'a' * 64}.jpg"
+
+    def setUp(self):
+        super().setUp()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.resize_cache = ResizeCache(cache_dir, 10 * 1024 * 1024)
+        self.enterContext(
+            mock.patch("projects.views.resize_cache", self.resize_cache)
+        )
+        content = image_bytes(size=(800, 600))
+        for name, data in (
+            (self.hashed, content),
+            ("images/legacy.jpg", content),
+            (".quarantine/images/legacy.jpg", content),
+            ("images/broken.jpg", content[: len(content) // 2]),
+        ):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data)
+
+    def get(self, size, path):
+        return self.client.get(f"/media/resize/{size}/{path}")
+
+    def image_size(self, response):
+        content = b"".join(response.streaming_content)
+        with PilImage.open(BytesIO(content)) as image:
+            return image.size
+
+    def test_cache_control(self):
+        response = self.get("320x0", self.hashed)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.get("320x0", "images/legacy.jpg")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=3600", response["Cache-Control"])
+
+    def test_dot_segments_are_not_served(self):
+        for path in (
+            ".quarantine/images/legacy.jpg",
+            "images/.hidden/../legacy.jpg",
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(self.get("320x0", path).status_code, 404)
+
+    def test_size_is_snapped_to_steps(self):
+        self.assertEqual(
+            self.image_size(self.get("300x0", self.hashed)), (320, 240)
+        )
+        self.assertEqual(
+            self.image_size(self.get("319x0", self.hashed)), (320, 240)
+        )
+        self.assertEqual(
+            self.image_size(self.get("320x0", self.hashed)), (320, 240)
+        )
+        # Все три запроса — один файл в кеше
+        files = [
+            name
+            for _, _, names in os.walk(self.resize_cache.directory)
+            for name in names
+            if not name.endswith(".lock")
+        ]
+        self.assertEqual(len(files), 1)
+
+        self.assertEqual(self.get("4000x0", self.hashed).status_code, 404)
+        self.assertEqual(self.get("0x0", self.hashed).status_code, 404)
+
+    def test_broken_images(self):
+        self.assertEqual(
+            self.get("320x0", "images/broken.jpg").status_code, 404
+        )
+
+        with override_settings(IMAGE_MAX_PIXELS=1000):
+            self.assertEqual(self.get("320x0", self.hashed).status_code, 413)
+
+        with mock.patch.object(PilImage, "MAX_IMAGE_PIXELS", 1000):
+            response = self.get("640x0", "images/legacy.jpg")
+        self.assertEqual(response.status_code, 413)
+
+
+@isolated_cache
+class ImageUploadTests(TemporaryMediaMixin, TestCase):
+    url = "/api/v1/upload/"
+
+    def upload(self, content, name="photo.jpg"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                self.url, {"file": ContentFile(content, name=name)}
+            )
+
+    def test_upload(self):
+        content = image_bytes("PNG")
+        # Расширение берется по сигнатуре, а не из имени файла
+        response = self.upload(content, name="photo.jpg")
+        self.assertEqual(response.status_code, 200)
+        digest = hashlib.sha256(content).hexdigest()
+        name = f"images/{digest[:2]}/{digest}.png"
+        self.assertTrue(response.json()["location"].endswith(name))
+        self.assertEqual(self.media_files(), [name])
+        self.assertEqual(ImageJob.objects.get().source, name)
+
+    def test_not_an_image(self):
+        response = self.upload(b"<?php echo 1; ?>" * 100)
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.media_files(), [])
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_empty_file(self):
+        self.assertEqual(self.upload(b"").status_code, 415)
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1000)
+    def test_too_large_while_streaming(self):
+        # Content-Length в пределах запаса на multipart: отказ по
+        # фактическому размеру при чтении чанков
+        content = image_bytes(size=(400, 400))
+        self.assertGreater(len(content), 1000)
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.media_files(), [])
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1000)
+    def test_too_large_by_content_length(self):
+        content = b"\xff\xd8\xff" + b"0" * (100 * 1024)
+        with mock.patch.object(
+            ImageUploadHandler, "receive_data_chunk"
+        ) as receive_mock:
+            response = self.upload(content)
+        self.assertEqual(response.status_code, 413)
+        # Тело запроса не разбиралось
+        receive_mock.assert_not_called()
+
+    def test_get(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+@isolated_cache
+class ImageUploadHandlerTests(TestCase):
+    def start(self, max_size=1000):
+        request = RequestFactory().post("/api/v1/upload/")
+        handler = ImageUploadHandler(request, max_size=max_size)
+        handler.new_file("file", "photo.jpg", "image/jpeg", None)
+        return handler
+
+    def test_rejected_chunk_stops_upload_and_removes_temp_file(self):
+        for chunks, status in (
+            ([b"GIF88a not an image"], 415),
+            ([b"\xff\xd8\xff" + b"0" * 600, b"0" * 600], 413),
+        ):
+            with self.subTest(status=status):
+                handler = self.start()
+                temp_path = handler.file.temporary_file_path()
+                with self.assertRaises(StopUpload) as raised:
+                    start = 0
+                    for chunk in chunks:
+                        handler.receive_data_chunk(chunk, start)
+                        start += len(chunk)
+                # Соединение сбрасывается, остаток тела не читается
+                self.assertTrue(raised.exception.connection_reset)
+                self.assertEqual(handler.error.status, status)
+                self.assertFalse(os.path.exists(temp_path))
+
+    def test_digest_and_extension(self):
+        handler = self.start(max_size=10**6)
+        content = image_bytes()
+        handler.receive_data_chunk(content[:100], 0)
+        handler.receive_data_chunk(content[100:], 100)
+        file = handler.file_complete(len(content))
+        self.addCleanup(file.close)
+        self.assertEqual(file.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(file.extension, ".jpg")
+        self.assertIsNone(handler.error)
+
+    def test_other_fields_are_skipped(self):
+        request = RequestFactory().post("/api/v1/upload/")
+        handler = ImageUploadHandler(request)
+        with self.assertRaises(SkipFile):
+            handler.new_file("other", "a.jpg", "image/jpeg", None)
+
+
+class OrphanedMediaTests(TemporaryMediaMixin, ContentTestCase):
+    hashed = f"images/aa/{'a' * 64}.jpg"
+    orphan_hashed = f"images/bb/{'b' * 64}.jpg"
+
+    def setUp(self):
+        super().setUp()
+        project = Project.objects.first()
+        Project.objects.filter(pk=project.pk).update(image=self.hashed)
+        detail = project.get_detail()
+        detail.detail_text = (
+            '<p><img src="http://example.com/media/images/editor.png"></p>'
+        )
+        detail.save()
+        self.old = timezone.now().timestamp() - 48 * 3600
+        for name in (
+            self.hashed,
+            # Производная того же содержимого
+            f"images/aa/{'a' * 64}.w320.opt.webp",
+            self.orphan_hashed,
+            "images/editor.png",
+            "images/legacy.jpg",
+            "images/legacy.opt.webp",
+        ):
+            self.write(name)
+
+    def write(self, name, mtime=None):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(b"data")
+        mtime = self.old if mtime is None else mtime
+        os.utime(path, (mtime, mtime))
+
+    def collect(self, *args):
+        output = StringIO()
+        call_command("collect_orphaned_media", *args, stdout=output)
+        return output.getvalue()
+
+    def test_reference_index(self):
+        index = ReferenceIndex()
+        index.add(None)
+        index.add(self.hashed)
+        index.add("images/legacy.jpg")
+        self.assertIn(f"images/aa/{'a' * 64}.w1600.opt.avif", index)
+        self.assertNotIn(self.orphan_hashed, index)
+        self.assertIn("images/legacy.jpg", index)
+        self.assertIn("images/legacy.opt.webp", index)
+        self.assertNotIn("images/legacy.w320.opt.webp", index)
+
+    def test_reference_index_from_database(self):
+        ImageJob.enqueue_upload("images/queued.jpg")
+        ImageDerivative.objects.create(
+            original="images/queued.jpg",
+            format="webp",
+            width=320,
+            height=240,
+            name="images/queued.w320.webp",
+        )
+        index = ReferenceIndex.build()
+        self.assertIn(self.hashed, index)
+        self.assertIn("images/editor.png", index)
+        self.assertIn("images/queued.jpg", index)
+        self.assertIn("images/queued.w320.webp", index)
+        self.assertNotIn(self.orphan_hashed, index)
+        self.assertNotIn("images/legacy.jpg", index)
+
+    def test_iter_media_files_resumes_after_cursor(self):
+        self.write(".media_gc.json")
+        names = [name for name, _ in iter_media_files(self.media_root)]
+        self.assertEqual(names, sorted(names))
+        self.assertNotIn(".media_gc.json", names)
+
+        cursor = names[2]
+        with mock.patch(
+            "projects.management.commands.collect_orphaned_media.os.scandir",
+            wraps=os.scandir,
+        ) as scandir_mock:
+            resumed = [
+                name for name, _ in iter_media_files(self.media_root, cursor)
+            ]
+        self.assertEqual(resumed, names[3:])
+        # Каталог images/aa целиком до курсора и не читается
+        scanned = [call.args[0] for call in scandir_mock.call_args_list]
+        self.assertNotIn(
+            os.path.join(self.media_root, "images", "aa"), scanned
+        )
+
+    def test_quarantine(self):
+        self.write("images/fresh.jpg", mtime=timezone.now().timestamp())
+        output = self.collect()
+        self.assertIn("обход завершен", output)
+
+        quarantined = {
+            name.removeprefix(f"{QUARANTINE_DIR}/")
+            for name in self.media_files()
+            if name.startswith(QUARANTINE_DIR)
+        }
+        self.assertEqual(
+            quarantined,
+            {
+                self.orphan_hashed,
+                "images/legacy.jpg",
+                "images/legacy.opt.webp",
+            },
+        )
+        remaining = set(self.media_files()) - {
+            f"{QUARANTINE_DIR}/{name}" for name in quarantined
+        }
+        # Используемые файлы и файлы моложе grace-периода на месте
+        self.assertLessEqual(
+            {self.hashed, "images/editor.png", "images/fresh.jpg"}, remaining
+        )
+
+        # Повторный запуск не трогает карантин
+        self.collect()
+        self.assertEqual(
+            len(
+                [n for n in self.media_files() if n.startswith(QUARANTINE_DIR)]
+            ),
+            3,
+        )
+
+    def test_incremental_runs(self):
+        # По два файла за запуск: курсор сохраняется между запусками
+        self.collect("--limit", "2")
+        with open(os.path.join(self.media_root, ".media_gc.json")) as file:
+            self.assertTrue(json.load(file)["cursor"])
+        self.assertIn(self.orphan_hashed, self.media_files())
+        # Шесть файлов: третий запуск доходит до конца дерева
+        self.collect("--limit", "2")
+        output = self.collect("--limit", "2")
+        self.assertIn("обход завершен", output)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.media_root, self.orphan_hashed))
+        )
+
+    def test_dry_run_and_delete(self):
+        output = self.collect("--dry-run")
+        self.assertIn(self.orphan_hashed, output)
+        self.assertIn(self.orphan_hashed, self.media_files())
+
+        ImageDerivative.objects.create(
+            original="images/legacy.jpg",
+            format="webp",
+            width=320,
+            height=240,
+            name="images/legacy.opt.webp",
+        )
+        self.collect("--delete", "--grace-hours", "1")
+        self.assertNotIn(self.orphan_hashed, self.media_files())
+        self.assertFalse(
+            any(name.startswith(QUARANTINE_DIR) for name in self.media_files())
+        )
+        self.assertFalse(ImageDerivative.objects.exists())
+
+
+class HTMLRewriterTests(ContentTestCase):
+    """Результат совпадает с прежней реализацией на BeautifulSoup
+    (``bench_html_rewriter.legacy_pipeline``)."""
+
+    cases = {
+        "table": "<p>Текст</p><table><tr><td>1</td></tr></table>",
+        "nested tables": (
+            "<table><tr><td><table><tr><td>1</td></tr></table>"
+            "</td></tr></table>"
+        ),
+        "wrapped table": (
+            '<div class="custom-table-wrapper"><table><tr><td>1</td></tr>'
+            "</table></div><div class='x custom-table-wrapper'><table>"
+            "</table></div>"
+        ),
+        "gt in quotes": (
+            '<img alt="a > b" src="../media/a.jpg">'
+            "<table title='x > y'><tr><td>1</td></tr></table>"
+        ),
+        "comments": (
+            "<!-- <table><tr><td>1</td></tr></table> -->"
+            '<p><!-- <img src="../media/a.jpg"> --></p><table></table>'
+        ),
+        "uppercase tags": (
+            '<TABLE BORDER="1"><TR><TD><IMG SRC="../media/a.jpg"></TD></TR>'
+            "</TABLE><P>Текст</P>"
+        ),
+        "absolute and relative src": (
+            '<p><img src="https://cdn.example.com/a.png" alt="">'
+            '<img src="media/b.jpg" width="10"><img alt="без src"></p>'
+        ),
+        "entities and unclosed tags": (
+            "<ul><li>Пункт &amp; <li>Второй</ul><p>&laquo;a&raquo;"
+            "<table><tr><td>1</table>"
+        ),
+        "void and self-closing": '<p><br><img src="a.jpg"/><hr/></p>',
+        "script": (
+            "<script>var t = '<table>';</script><table></table>"
+            "<style>td > p { color: red }</style>"
+        ),
+    }
+
+    def rewrite(self, markup):
+        base_url = bench_html_rewriter.BASE_URL
+        return HTMLRewriter(
+            [AbsoluteImageSrc(base_url), WrapTables()]
+        ).rewrite(markup)
+
+    def test_matches_beautifulsoup_on_normalized_html(self):
+        for name, markup in self.cases.items():
+            # Сохраненный ранее detail_text уже прошел через BeautifulSoup
+            stored = bench_html_rewriter.normalize(markup)
+            with self.subTest(name):
+                self.assertEqual(
+                    self.rewrite(stored),
+                    bench_html_rewriter.legacy_pipeline(stored),
+                )
+
+    def test_matches_beautifulsoup_on_raw_html(self):
+        for name, markup in self.cases.items():
+            with self.subTest(name):
+                self.assertEqual(
+                    bench_html_rewriter.normalize(self.rewrite(markup)),
+                    bench_html_rewriter.legacy_pipeline(markup),
+                )
+
+    def test_transform_without_hooks(self):
+        markup = self.cases["uppercase tags"]
+        self.assertEqual(HTMLRewriter([Transform()]).rewrite(markup), markup)
+
+    def test_detail_html(self):
+        with mock.patch.object(
+            bench_html_rewriter, "BASE_URL", settings.SITE_URL
+        ):
+            for name, markup in self.cases.items():
+                project = Project.objects.create(
+                    title=name, detail_text=markup, user=self.user
+                )
+                detail = Project.objects.get(pk=project.pk).detail
+                with self.subTest(name):
+                    self.assertEqual(
+                        bench_html_rewriter.normalize(detail.detail_html),
+                        bench_html_rewriter.legacy_pipeline(markup),
+                    )
+
+
+@isolated_cache
+class SharedCacheCheckTests(TestCase):
+    def test_locmem_in_production(self):
+        with override_settings(DEBUG=False, CACHE_BACKEND="locmem"):
+            (warning,) = check_shared_cache(None)
+        self.assertEqual(warning.id, "projects.W001")
+        for overrides in (
+            {"DEBUG": True, "CACHE_BACKEND": "locmem"},
+            {"DEBUG": False, "CACHE_BACKEND": "file"},
+        ):
+            with self.subTest(**overrides), override_settings(**overrides):
+                self.assertEqual(check_shared_cache(None), [])
@@ -0,0 +1,104 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import (
+    SkipFile,
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+# Сигнатуры поддерживаемых форматов: (смещение, байты, расширение)
+IMAGE_SIGNATURES = (
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (8, b"WEBP", ".webp"),
+    (4, b"ftypavif", ".avif"),
+)
+
+# Запас на заголовки multipart сверх размера самого файла
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def sniff_image_extension(header):
+    """Определяет формат изображения по первым байтам файла."""
+    for offset, signature, extension in IMAGE_SIGNATURES:
+        if header[offset:].startswith(signature):
+            return extension
+    return None
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Потоковый прием изображения для ``/api/v1/upload/``.
+
+    Чанки сразу пишутся во временный файл, по пути считается sha256
+    и по первому чанку проверяется сигнатура изображения. Слишком большие
+    и не графические загрузки отклоняются, не дочитывая тело запроса, так
+    что память на загрузку не зависит от размера файла. Причина отказа
+    сохраняется в ``self.error``.
+    """
+
+    field_name = "file"
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size or settings.IMAGE_UPLOAD_MAX_BYTES
+        self.error = None
+
+    def handle_raw_input(
+        self, input_data, META, content_length, boundary, encoding=None
+    ):
+        if content_length > self.max_size + MULTIPART_OVERHEAD:
+            self.error = UploadRejected("Файл слишком большой", 413)
+            # Пустой результат прерывает разбор: тело запроса не читается
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, field_name, *args, **kwargs):
+        if field_name != self.field_name:
+            raise SkipFile()
+        super().new_file(field_name, *args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.extension = None
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.extension is None:
+            self.extension = sniff_image_extension(raw_data[:16])
+            if self.extension is None:
+                self.reject(
+                    UploadRejected("Файл не является изображением", 415)
+                )
+
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self.reject(UploadRejected("Файл слишком большой", 413))
+
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.extension is None:
+            # Пустой файл: в FILES он не попадет
+            self.error = UploadRejected("Файл не является изображением", 415)
+            self.upload_interrupted()
+            return None
+
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        file.extension = self.extension
+        return file
+
+    def reject(self, error):
+        self.error = error
+        # Недописанный временный файл парсер сам не удаляет
+        self.upload_interrupted()
+        raise StopUpload(connection_reset=True)
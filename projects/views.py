@@ -1,21 +1,59 @@
-from django.core.files.storage import FileSystemStorage
-from django.http import JsonResponse
+import base64
+import functools
+import hashlib
+import json
+import os
+from datetime import datetime
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.paginator import Paginator
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotAllowed,
+    JsonResponse,
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.functional import cached_property
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django_filters import BaseInFilter, FilterSet, NumberFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from PIL import Image as PilImage
 from rest_framework import generics, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.mixins import ListModelMixin
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import Article, Initiative, Project
+from .cache import cached_count, cached_validators, response_cache_key
+from .db_router import pinned_to_primary, replica_reads
+from .images import (
+    FORMAT_MIME_TYPES,
+    IMAGES_DIR,
+    ImageTooLarge,
+    negotiate_format,
+    render_resized,
+    snap_to_steps,
+)
+from .models import Article, ArticleCategory, ImageJob, Initiative, Project
 from .permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
+from .resize_cache import ResizeCache
 from .serializers import (
     ArticleSerializer,
     InitiativeSerializer,
@@ -23,14 +61,191 @@ from .serializers import (
     RegisterSerializer,
     UserSerializer,
 )
+from .storage import image_storage, is_content_addressed
+from .uploads import ImageUploadHandler
+
+
+def encode_cursor(time_create, pk, reverse=False):
+    payload = {"t": time_create.isoformat(), "i": pk}
+    if reverse:
+        payload["r"] = 1
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Возвращает ``((time_create, pk), reverse)`` или ``(None, False)``
+    для пустого курсора (первая страница)."""
+    if not cursor:
+        return None, False
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        position = (
+            datetime.fromisoformat(payload["t"]),
+            int(payload["i"]),
+        )
+        return position, bool(payload.get("r"))
+    except (ValueError, TypeError, KeyError):
+        raise NotFound("Неверный курсор")
+
+
+class CachedCountPaginator(Paginator):
+    """COUNT(*) берется из кеша по сигнатуре запроса и версии модели."""
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list)
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 3
     page_size_query_param = "page_size"
     max_page_size = 100
+    django_paginator_class = CachedCountPaginator
+
+    # ?count=false отключает подсчет: вместо count и total_pages
+    # отдается has_more, а страница читается с одной лишней строкой
+    count_query_param = "count"
+
+    # Курсорный режим включается параметром ?cursor= (пустой — первая
+    # страница). Страницы идут по ключу (time_create, id) без OFFSET, поэтому
+    # их стоимость не зависит от глубины, а новые записи не сдвигают границы
+    cursor_query_param = "cursor"
+    cursor_ordering = ("time_create", "id")
+    cursor_mode = False
+    count_mode = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            if request.query_params.get(self.count_query_param) in (
+                "0",
+                "false",
+            ):
+                return self.paginate_without_count(queryset, request)
+            return super().paginate_queryset(queryset, request, view)
+
+        self.cursor_mode = True
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        position, reverse = decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+
+        time_field, pk_field = self.cursor_ordering
+        # Значения ключа читаем из аннотации: .only() мог их отложить
+        queryset = queryset.annotate(
+            _cursor_time=F(time_field), _cursor_pk=F(pk_field)
+        )
+        if reverse:
+            queryset = queryset.order_by(f"-{time_field}", f"-{pk_field}")
+        else:
+            queryset = queryset.order_by(time_field, pk_field)
+
+        if position is not None:
+            time_value, pk_value = position
+            lookup = "lt" if reverse else "gt"
+            # Граница по time_create вынесена из OR, чтобы БД искала по
+            # индексу (time_create, id) диапазоном, а не сканировала его
+            # с начала
+            queryset = queryset.filter(
+                Q(**{f"{time_field}__{lookup}e": time_value}),
+                Q(**{f"{time_field}__{lookup}": time_value})
+                | Q(**{f"{pk_field}__{lookup}": pk_value}),
+            )
+
+        # Лишняя строка показывает, есть ли что-то за страницей
+        rows = list(queryset[: self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[: self.page_size_value]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else has_more
+        self.rows = rows
+        return rows
+
+    def paginate_without_count(self, queryset, request):
+        self.count_mode = False
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1)
+            )
+        except ValueError:
+            raise NotFound("Неверная страница")
+        if self.page_number < 1:
+            raise NotFound("Неверная страница")
+
+        # Лишняя строка показывает, есть ли следующая страница
+        offset = (self.page_number - 1) * self.page_size_value
+        limit = offset + self.page_size_value + 1
+        rows = list(queryset[offset:limit])
+        self.has_next = len(rows) > self.page_size_value
+        self.rows = rows[: self.page_size_value]
+        return self.rows
+
+    def get_page_link(self, page_number):
+        url = self.request.build_absolute_uri()
+        if page_number == 1:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, page_number)
+
+    def get_cursor_link(self, row, reverse):
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        cursor = encode_cursor(row._cursor_time, row._cursor_pk, reverse)
+        return replace_query_param(url, self.cursor_query_param, cursor)
 
     def get_paginated_response(self, data):
+        if not self.count_mode:
+            return Response(
+                {
+                    "pagination": {
+                        "count": None,
+                        "has_more": self.has_next,
+                        "next": (
+                            self.get_page_link(self.page_number + 1)
+                            if self.has_next
+                            else None
+                        ),
+                        "previous": (
+                            self.get_page_link(self.page_number - 1)
+                            if self.page_number > 1
+                            else None
+                        ),
+                        "limit": self.page_size_value,
+                        "offset": (self.page_number - 1)
+                        * self.page_size_value,
+                        "total_pages": None,
+                        "current_page": self.page_number,
+                    },
+                    "results": data,
+                }
+            )
+        if self.cursor_mode:
+            return Response(
+                {
+                    "pagination": {
+                        "next": (
+                            self.get_cursor_link(self.rows[-1], False)
+                            if self.has_next and self.rows
+                            else None
+                        ),
+                        "previous": (
+                            self.get_cursor_link(self.rows[0], True)
+                            if self.has_previous and self.rows
+                            else None
+                        ),
+                        "limit": self.page_size_value,
+                    },
+                    "results": data,
+                }
+            )
+
         # Вычисляем общее количество страниц
         total_pages = self.page.paginator.num_pages
 
@@ -57,63 +272,276 @@ class CustomPagination(PageNumberPagination):
         )
 
 
+class TimestampFilter(NumberFilter):
+    """Фильтр по дате в Unix-времени — в том же виде, в каком API отдает
+    time_create и time_update."""
+
+    def filter(self, qs, value):
+        if value is not None:
+            try:
+                value = datetime.fromtimestamp(float(value), dt_timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                raise ValidationError({self.field_name: "Неверная дата"})
+        return super().filter(qs, value)
+
+
+class NumberInFilter(BaseInFilter, NumberFilter):
+    """``?id__in=1,2``: значения проверяются как числа, а не передаются
+    в запрос строками."""
+
+
+# Внешние ключи, по которым можно фильтровать (?project_id=3,
+# ?initiative_id__in=1,2)
+FILTERABLE_RELATIONS = ("project_id", "initiative_id", "cat_id")
+
+
+@functools.cache
 def create_filterset(model_class):
-    """Фабрика, создающая FilterSet с полной фильтрацией (exact, in, exclude)."""
+    """Фабрика, создающая FilterSet с полной фильтрацией (exact, in, exclude).
+
+    Класс строится один раз на модель."""
+
+    relations = [
+        field.name
+        for field in model_class._meta.concrete_fields
+        if field.name in FILTERABLE_RELATIONS
+    ]
 
     class CustomFilter(FilterSet):
         # Фильтр для id__in (обычный)
-        id__in = BaseInFilter(field_name="id", lookup_expr="in")
+        id__in = NumberInFilter(field_name="id", lookup_expr="in")
 
         # Фильтр для id__exclude (исключающий)
-        id__exclude = BaseInFilter(
+        id__exclude = NumberInFilter(
             field_name="id", exclude=True, lookup_expr="in"
         )
 
+        # Диапазоны дат: ?time_create__gte=1700000000
+        time_create__gte = TimestampFilter(
+            field_name="time_create", lookup_expr="gte"
+        )
+        time_create__lte = TimestampFilter(
+            field_name="time_create", lookup_expr="lte"
+        )
+        time_update__gte = TimestampFilter(
+            field_name="time_update", lookup_expr="gte"
+        )
+        time_update__lte = TimestampFilter(
+            field_name="time_update", lookup_expr="lte"
+        )
+
         class Meta:
             model = model_class
             fields = {
                 "id": ["exact"],  # Поддержка ?id=42
+                "is_published": ["exact"],
+                **{relation: ["exact", "in"] for relation in relations},
+            }
+            # Ключ как число: ModelChoiceFilter проверял бы его запросом
+            filter_overrides = {
+                models.ForeignKey: {"filter_class": NumberFilter},
             }
 
     return CustomFilter
 
 
-def create_views(model_class, serializer_model_class):
-    class ListCreateView(generics.ListCreateAPIView):
-        queryset = model_class.objects.filter(is_published=True).order_by(
-            "time_create"
+class VaryOnAcceptMixin:
+    """Ответ зависит от Accept: по нему DRF выбирает рендерер (JSON или
+    browsable API), поэтому кеши должны различать такие запросы."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        patch_vary_headers(response, ["Accept"])
+        return response
+
+
+class SerializerQuerysetMixin:
+    """Готовит queryset под связи и поля, которые прочитает сериализатор
+    (см. ``QuerysetOptimizationMixin``)."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if isinstance(self, ListModelMixin):
+            # Набор полей в списке свой (detail_only_fields): берем
+            # сериализатор элемента списка
+            serializer = self.get_serializer(many=True).child
+        else:
+            serializer = self.get_serializer()
+        return serializer.setup_queryset(queryset)
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified по ``time_update`` и числу строк.
+
+    Валидаторы считаются одним агрегатным запросом по тем же фильтрам,
+    что и ответ (для детального ответа — по одному объекту), и кешируются
+    по версиям моделей (``cached_validators``). Если клиент прислал
+    совпадающие If-None-Match / If-Modified-Since, отдается 304 без
+    сериализации. ETag сохраняется в ``self.etag``: ``ResponseCacheMixin``
+    кеширует тело под ним, чтобы тело и ETag не расходились.
+    """
+
+    etag = None
+
+    def get_validators(self, request):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg in self.kwargs:
+            queryset = self.get_queryset().filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        else:
+            queryset = self.filter_queryset(self.get_queryset())
+
+        last_modified, count = cached_validators(
+            queryset, getattr(self, "cache_related_models", ())
+        )
+        if not count:
+            return None, None
+
+        # Представление зависит и от формата ответа (JSON, browsable API)
+        variant = (
+            last_modified.isoformat(),
+            count,
+            request.accepted_renderer.format,
+        )
+        etag = hashlib.sha1(repr(variant).encode()).hexdigest()
+        return int(last_modified.timestamp()), f'"{etag}"'
+
+    def get(self, request, *args, **kwargs):
+        last_modified, etag = self.get_validators(request)
+        self.etag = etag
+        if etag is None:
+            return super().get(request, *args, **kwargs)
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code in (
+            status.HTTP_200_OK,
+            status.HTTP_304_NOT_MODIFIED,
+        ):
+            response["ETag"] = etag
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+
+class ReplicaReadMixin:
+    """GET-запросы читают модели приложения с реплики (см.
+    ``projects.db_router``); запись и авторизация остаются на основной
+    базе."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class ResponseCacheMixin:
+    """Кеширует данные GET-ответа (до рендеринга).
+
+    Ключ строится из URL с query string, области авторизации, ETag
+    (если его посчитал ``ConditionalGetMixin``) и версий модели
+    и ``cache_related_models``: запись в любую из них (см.
+    ``projects.signals``) делает закешированные ответы недостижимыми,
+    а тело не отдается с ETag другого состояния данных. Пока чтения
+    закреплены за основной базой, кеш обходится: клиент должен увидеть
+    свою запись, а не ответ, прочитанный с реплики.
+    """
+
+    cache_related_models = ()
+
+    def get(self, request, *args, **kwargs):
+        if pinned_to_primary():
+            return super().get(request, *args, **kwargs)
+
+        key = response_cache_key(
+            self.queryset.model,
+            self.cache_related_models,
+            request,
+            getattr(self, "etag", None) or "",
         )
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+
+def create_views(model_class, serializer_model_class, related_models=()):
+    """``related_models`` — модели, изменение которых меняет ответы
+    (например, статьи для списка проектов)."""
+
+    class ListCreateView(
+        ReplicaReadMixin,
+        ConditionalGetMixin,
+        ResponseCacheMixin,
+        SerializerQuerysetMixin,
+        VaryOnAcceptMixin,
+        generics.ListCreateAPIView,
+    ):
+        queryset = model_class.objects.order_by("time_create", "id")
         serializer_class = serializer_model_class
         permission_classes = (IsAuthenticatedOrReadOnly,)
         pagination_class = CustomPagination
+        cache_related_models = related_models
         filter_backends = [DjangoFilterBackend]
-
-        @property
-        def filterset_class(self):
-            """Динамически создаем FilterSet для текущей модели."""
-            return create_filterset(model_class)
-
-    class UpdateView(generics.RetrieveUpdateAPIView):
+        filterset_class = create_filterset(model_class)
+
+        def get_queryset(self):
+            queryset = super().get_queryset()
+            # Черновики (?is_published=false) видны только персоналу
+            if not (
+                self.request.user.is_staff
+                and "is_published" in self.request.query_params
+            ):
+                queryset = queryset.filter(is_published=True)
+            return queryset
+
+    class UpdateView(
+        ReplicaReadMixin,
+        ConditionalGetMixin,
+        ResponseCacheMixin,
+        SerializerQuerysetMixin,
+        VaryOnAcceptMixin,
+        generics.RetrieveUpdateAPIView,
+    ):
         queryset = model_class.objects.all()
         serializer_class = serializer_model_class
         permission_classes = (IsOwnerOrReadOnly,)
-
-    class DestroyView(generics.RetrieveDestroyAPIView):
+        cache_related_models = related_models
+
+    class DestroyView(
+        ReplicaReadMixin,
+        ConditionalGetMixin,
+        ResponseCacheMixin,
+        SerializerQuerysetMixin,
+        VaryOnAcceptMixin,
+        generics.RetrieveDestroyAPIView,
+    ):
         queryset = model_class.objects.all()
         serializer_class = serializer_model_class
         permission_classes = (IsAdminOrReadOnly,)
+        cache_related_models = related_models
 
     return ListCreateView, UpdateView, DestroyView
 
 
 ProjectAPIList, ProjectAPIUpdate, ProjectAPIDestroy = create_views(
-    Project, ProjectSerializer
+    Project, ProjectSerializer, related_models=(Initiative, Article)
 )
 InitiativeAPIList, InitiativeAPIUpdate, InitiativeAPIDestroy = create_views(
-    Initiative, InitiativeSerializer
+    Initiative, InitiativeSerializer, related_models=(Project, Article)
 )
 ArticleAPIList, ArticleAPIUpdate, ArticleAPIDestroy = create_views(
-    Article, ArticleSerializer
+    Article, ArticleSerializer, related_models=(Initiative, ArticleCategory)
 )
 
 
@@ -153,18 +581,100 @@ class RegisterView(APIView):
 
 @csrf_exempt
 def upload_image(request):
-    if request.method == "POST" and request.FILES.get("file"):
-        file = request.FILES["file"]
+    if request.method != "POST":
+        return JsonResponse({"error": "Upload failed"}, status=400)
+
+    # Обработчик должен быть установлен до первого обращения к FILES
+    handler = ImageUploadHandler(request)
+    request.upload_handlers = [handler]
+    file = request.FILES.get("file")
+
+    if handler.error:
+        return JsonResponse(
+            {"error": str(handler.error)}, status=handler.error.status
+        )
+    if not file:
+        return JsonResponse({"error": "Upload failed"}, status=400)
+
+    # Сохранение изображения: одинаковые файлы хранятся один раз,
+    # для дубликата возвращается URL уже существующего файла.
+    # Расширение берем по сигнатуре, а не из имени, присланного клиентом
+    filename = image_storage.save(
+        os.path.join(IMAGES_DIR, f"upload{file.extension}"), file
+    )
+    file_url = image_storage.url(filename)  # Получение URL к файлу
 
-        # Сохранение изображения
-        fs = FileSystemStorage()
-        filename = fs.save(file.name, file)  # Сохранение файла в MEDIA_ROOT
-        file_url = fs.url(filename)  # Получение URL к файлу
+    # Варианты и метаданные создаст воркер очереди изображений
+    transaction.on_commit(lambda: ImageJob.enqueue_upload(filename))
 
-        # Создание абсолютного URL
-        absolute_url = request.build_absolute_uri(file_url)
+    # Создание абсолютного URL
+    absolute_url = request.build_absolute_uri(file_url)
 
-        # return JsonResponse({"location": file_url})
-        return JsonResponse({"location": absolute_url})
+    # return JsonResponse({"location": file_url})
+    return JsonResponse({"location": absolute_url})
 
-    return JsonResponse({"error": "Upload failed"}, status=400)
+
+resize_cache = ResizeCache(
+    settings.RESIZE_CACHE_DIR, settings.RESIZE_CACHE_MAX_BYTES
+)
+
+
+# Файлы без адресации по содержимому могут смениться под тем же URL
+MUTABLE_IMAGE_MAX_AGE = 3600
+
+
+def resize_image(request, width, height, path):
+    """Отдает изображение из MEDIA_ROOT, вписанное в ``width`` x ``height``.
+
+    Размеры округляются вверх до ступеней ``RESIZE_STEPS``, чтобы число
+    вариантов одного файла (и работа на их рендер) было ограничено.
+    Формат выбирается по заголовку Accept, результат кешируется на диске.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return HttpResponseNotAllowed(["GET", "HEAD"])
+
+    steps = settings.RESIZE_STEPS
+    if not (width or height) or max(width, height) > max(steps):
+        raise Http404
+    width, height = snap_to_steps(width, steps), snap_to_steps(height, steps)
+
+    # Служебные каталоги (карантин, состояние сборщика) не отдаются
+    if any(part.startswith(".") for part in path.split("/")):
+        raise Http404
+    try:
+        source_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(source_path):
+        raise Http404
+
+    fmt = negotiate_format(request.headers.get("Accept"))
+    # mtime в ключе сбрасывает кеш, если файл перезаписали на месте
+    key = f"{path}|{width}x{height}|{fmt}|{os.path.getmtime(source_path)}"
+
+    try:
+        file = resize_cache.open_or_render(
+            key,
+            fmt,
+            lambda target_path: render_resized(
+                source_path,
+                target_path,
+                (width, height),
+                fmt,
+                settings.IMAGE_MAX_PIXELS,
+            ),
+        )
+    except (ImageTooLarge, PilImage.DecompressionBombError):
+        return HttpResponse("Изображение слишком большое", status=413)
+    except OSError:
+        # Не изображение (UnidentifiedImageError) или обрезанный файл
+        raise Http404
+
+    response = FileResponse(file, content_type=FORMAT_MIME_TYPES[fmt])
+    if is_content_addressed(path):
+        # Содержимое по этому пути не меняется никогда
+        response["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response["Cache-Control"] = f"public, max-age={MUTABLE_IMAGE_MAX_AGE}"
+    patch_vary_headers(response, ["Accept"])
+    return response